@@ -0,0 +1,60 @@
+import json
+import math
+import os
+from typing import List, Type
+
+from pydantic import BaseModel
+
+# Rough size model: ~4 characters per token for English Markdown and JSON
+CHARS_PER_TOKEN = 4
+# Expected output size of one field. Long Markdown sections dominate; diagrams are short.
+TEXT_FIELD_TOKENS = int(os.environ.get("LLM_TEXT_FIELD_TOKENS", "1500"))
+MERMAID_FIELD_TOKENS = int(os.environ.get("LLM_MERMAID_FIELD_TOKENS", "700"))
+# Share of max_tokens a single call may plan to use, leaving room for JSON overhead and long answers
+OUTPUT_HEADROOM = float(os.environ.get("LLM_OUTPUT_HEADROOM", "0.8"))
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_output_tokens(fields: List[str]) -> int:
+    return sum(MERMAID_FIELD_TOKENS if name.endswith("_mermaid") else TEXT_FIELD_TOKENS for name in fields)
+
+
+def output_budget(max_tokens: int) -> int:
+    """Output tokens a single call may plan for."""
+    return max(1, int(max_tokens * OUTPUT_HEADROOM))
+
+
+def split_fields(fields: List[str], max_tokens: int) -> List[List[str]]:
+    """
+    Splits a schema's fields into as few groups as needed for each group's
+    expected output to fit in max_tokens, keeping the order and balancing the
+    groups so concurrent calls finish at about the same time.
+    """
+    budget = output_budget(max_tokens)
+    groups = min(len(fields), max(1, math.ceil(estimate_output_tokens(fields) / budget)))
+    size, extra = divmod(len(fields), groups)
+    result, start = [], 0
+    for i in range(groups):
+        end = start + size + (1 if i < extra else 0)
+        result.append(fields[start:end])
+        start = end
+    return result
+
+
+def format_instructions(model: Type[BaseModel]) -> str:
+    """
+    Compact replacement for JsonOutputParser.get_format_instructions(): the
+    same fenced schema block, without the worked example and titles.
+    """
+    properties = {
+        name: {"type": "string", "description": info.description or ""}
+        for name, info in model.model_fields.items()
+    }
+    schema = {"properties": properties, "required": list(properties)}
+    return (
+        "Return a single JSON object that conforms to this schema. Every value is a string.\n"
+        f"```\n{json.dumps(schema, ensure_ascii=False)}\n```"
+    )
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+CHECKPOINT_DB = os.environ.get("CHECKPOINT_DB", os.path.join(".checkpoints", "runs.sqlite"))
+# Separate file so registry updates never contend with checkpoint writes for the SQLite lock
+REGISTRY_DB = os.path.join(os.path.dirname(CHECKPOINT_DB), "runs_index.sqlite")
+
+
+def new_run_id() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+def run_config(run_id: str) -> Dict:
+    """LangGraph config addressing one run's checkpoint thread."""
+    return {"configurable": {"thread_id": run_id}}
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+def open_checkpointer(path: str = CHECKPOINT_DB) -> SqliteSaver:
+    """Durable checkpointer persisting every completed node of every run."""
+    return SqliteSaver(_connect(path))
+
+
+def open_async_checkpointer(path: str = CHECKPOINT_DB):
+    """Async context manager yielding the same checkpointer for ainvoke/astream runs."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return AsyncSqliteSaver.from_conn_string(path)
+
+
+class RunRegistry:
+    """
+    Human-facing index of checkpointed runs (topic, status, last node), kept
+    next to the LangGraph checkpoint database.
+    """
+
+    def __init__(self, path: str = REGISTRY_DB):
+        self.path = path
+        self._conn = _connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY,"
+            " topic TEXT NOT NULL,"
+            " output_dir TEXT,"
+            " status TEXT NOT NULL,"
+            " last_node TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def start(self, run_id: str, topic: str, output_dir: str):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO runs (run_id, topic, output_dir, status, last_node, created_at, updated_at)"
+            " VALUES (?, ?, ?, 'running', NULL, ?, ?)",
+            (run_id, topic, output_dir, now, now),
+        )
+        self._conn.commit()
+
+    def update(self, run_id: str, status: Optional[str] = None, last_node: Optional[str] = None):
+        self._conn.execute(
+            "UPDATE runs SET status = COALESCE(?, status), last_node = COALESCE(?, last_node), updated_at = ?"
+            " WHERE run_id = ?",
+            (status, last_node, time.time(), run_id),
+        )
+        self._conn.commit()
+
+    def get(self, run_id: str) -> Optional[Dict]:
+        rows = self._rows("WHERE run_id = ?", (run_id,))
+        return rows[0] if rows else None
+
+    def list(self) -> List[Dict]:
+        return self._rows("ORDER BY updated_at DESC", ())
+
+    def _rows(self, clause: str, params) -> List[Dict]:
+        cursor = self._conn.execute(
+            f"SELECT run_id, topic, output_dir, status, last_node, created_at, updated_at FROM runs {clause}", params
+        )
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def prune(self, older_than_days: float, checkpointer: SqliteSaver) -> List[str]:
+        """Deletes runs (and their checkpoints) not updated for the given number of days."""
+        cutoff = time.time() - older_than_days * 86400
+        stale = [r["run_id"] for r in self._rows("WHERE updated_at < ?", (cutoff,))]
+        for run_id in stale:
+            checkpointer.delete_thread(run_id)
+            self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            self._conn.commit()
+        return stale
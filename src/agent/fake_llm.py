@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import math
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+SCHEMA_BLOCK = re.compile(r"```\s*(\{.*?\})\s*```", re.DOTALL)
+# Size of each piece of a streamed fake response
+STREAM_CHUNK_CHARS = 200
+
+
+def _schema_properties(text: str) -> Dict[str, Dict[str, Any]]:
+    """Extracts the JSON schema properties embedded in the format instructions."""
+    for block in reversed(SCHEMA_BLOCK.findall(text)):
+        try:
+            schema = json.loads(block)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(schema.get("properties"), dict) and schema["properties"]:
+            return schema["properties"]
+    return {}
+
+
+def _fake_mermaid(field: str, seed: str, valid: bool = True) -> str:
+    if "flow" in field:
+        diagram = (
+            "sequenceDiagram\n"
+            "    participant Client\n"
+            "    participant Service\n"
+            f"    Client->>Service: Request {seed}\n"
+            "    Service-->>Client: Response"
+        )
+    else:
+        diagram = (
+            "graph TD\n"
+            f"    Client[Client {seed}] --> Gateway(API Gateway)\n"
+            "    Gateway --> Service[Core Service]\n"
+            "    Service --> Store[(Data Store)]"
+        )
+    # Flowcharts get past the in-process pre-check and fail in the renderer;
+    # sequence diagrams are already rejected by the pre-check
+    return diagram if valid else diagram + "\n    style INVALID"
+
+
+def _malform(content: str) -> str:
+    """Prose, a code fence and raw newlines inside strings: what lenient parsing has to undo."""
+    return "Here is the requested JSON:\n```json\n" + content.replace("\\n", "\n") + "\n```"
+
+
+def _fake_markdown(field: str, info: Dict[str, Any], seed: str) -> str:
+    title = info.get("title", field)
+    description = info.get("description", "")
+    return f"### {title}\n\n{description} (generated offline, ref {seed}).\n\n- Point one\n- Point two"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline stand-in for Gemini.
+    Answers every prompt with a JSON object matching the output schema found in
+    the format instructions; Mermaid fields get small diagrams that pass
+    validation. The same prompt always yields the same response.
+    mermaid_mode and json_mode degrade the answers to exercise retry paths.
+    """
+
+    model: str = "fake-chat"
+    temperature: float = 0.0
+    max_tokens: int = 8192
+    latency_seconds: float = 0.0
+    # Scenario knobs for benchmarks and failure-path testing
+    mermaid_mode: str = "valid"  # valid | invalid (every diagram fails rendering)
+    json_mode: str = "clean"     # clean | malformed (needs local repair) | truncated (cut off at 70%)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "temperature": self.temperature, "max_tokens": self.max_tokens}
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        properties = _schema_properties(prompt)
+        payload = {}
+        for field, info in properties.items():
+            if field.endswith("_mermaid"):
+                payload[field] = _fake_mermaid(field, seed, valid=self.mermaid_mode != "invalid")
+            else:
+                payload[field] = _fake_markdown(field, info, seed)
+        content = json.dumps(payload, ensure_ascii=False)
+        if self.json_mode == "malformed":
+            return _malform(content)
+        if self.json_mode == "truncated":
+            return content[:int(len(content) * 0.7)]
+        return content
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency_seconds:
+            time.sleep(min(self.latency_seconds, kwargs.get("timeout") or math.inf))
+        self._check_timeout(kwargs.get("timeout"))
+        return self._chat_result(messages)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Simulated latency must not hold a thread, like a real network wait
+        if self.latency_seconds:
+            await asyncio.sleep(min(self.latency_seconds, kwargs.get("timeout") or math.inf))
+        self._check_timeout(kwargs.get("timeout"))
+        return self._chat_result(messages)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # Same response and total latency as _generate, spread over the chunks
+        if kwargs.get("timeout") and self.latency_seconds > kwargs["timeout"]:
+            time.sleep(kwargs["timeout"])
+            self._check_timeout(kwargs["timeout"])
+        chunks = self._chunks(messages)
+        for chunk in chunks:
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds / len(chunks))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        if kwargs.get("timeout") and self.latency_seconds > kwargs["timeout"]:
+            await asyncio.sleep(kwargs["timeout"])
+            self._check_timeout(kwargs["timeout"])
+        chunks = self._chunks(messages)
+        for chunk in chunks:
+            if self.latency_seconds:
+                await asyncio.sleep(self.latency_seconds / len(chunks))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _check_timeout(self, timeout: Optional[float]):
+        """Fails like a real request when the simulated latency exceeds the per-call timeout."""
+        if timeout and self.latency_seconds > timeout:
+            raise TimeoutError(f"Fake request timed out after {timeout:.2f}s.")
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], content: str) -> Dict[str, int]:
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        return {
+            "input_tokens": prompt_chars // 4,
+            "output_tokens": len(content) // 4,
+            "total_tokens": prompt_chars // 4 + len(content) // 4,
+        }
+
+    def _chunks(self, messages: List[BaseMessage]) -> List[ChatGenerationChunk]:
+        content = self._respond(messages)
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)] or [""]
+        chunks = [ChatGenerationChunk(message=AIMessageChunk(content=piece)) for piece in pieces]
+        # Usage is reported once, on the last chunk, as real streaming APIs do
+        chunks[-1] = ChatGenerationChunk(message=AIMessageChunk(content=pieces[-1], usage_metadata=self._usage(messages, content)))
+        return chunks
+
+    def _chat_result(self, messages: List[BaseMessage]) -> ChatResult:
+        content = self._respond(messages)
+        message = AIMessage(content=content, usage_metadata=self._usage(messages, content))
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -1,58 +1,78 @@
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from src.agent.state import AgentState
+from src.utils.metrics import ainstrument_node, instrument_node
 from src.agent.nodes import (
-    lead_architect,
-    visual_architect,
-    diagram_validator,
-    backend_engineer,
-    infra_security_devops,
-    governance_lead,
-    mkdocs_compiler
+    lead_architect, alead_architect,
+    visual_architect, avisual_architect,
+    diagram_validator, adiagram_validator,
+    backend_engineer, abackend_engineer,
+    infra_security_devops, ainfra_security_devops,
+    governance_lead, agovernance_lead,
+    diagrams_complete,
+    mkdocs_compiler, amkdocs_compiler,
+    pending_diagram_keys
 )
 
-def build_graph() -> StateGraph:
+def _node(func, afunc):
+    """
+    Pairs a node with its async twin so the same graph serves invoke/stream and
+    ainvoke/astream. Both run inside a timed span of the current run's metrics.
+    """
+    name = func.__name__
+    return RunnableLambda(instrument_node(name, func), afunc=ainstrument_node(name, afunc), name=name)
+
+def build_graph(checkpointer=None) -> StateGraph:
+    """Compiles the workflow; pass a checkpointer to persist state after every node."""
     workflow = StateGraph(AgentState)
     
     # 1. Add all specialized node actors
-    workflow.add_node("lead_architect", lead_architect)
-    workflow.add_node("visual_architect", visual_architect)
-    workflow.add_node("diagram_validator", diagram_validator)
-    workflow.add_node("backend_engineer", backend_engineer)
-    workflow.add_node("infra_security_devops", infra_security_devops)
-    workflow.add_node("governance_lead", governance_lead)
-    workflow.add_node("mkdocs_compiler", mkdocs_compiler)
+    workflow.add_node("lead_architect", _node(lead_architect, alead_architect))
+    workflow.add_node("visual_architect", _node(visual_architect, avisual_architect))
+    workflow.add_node("diagram_validator", _node(diagram_validator, adiagram_validator))
+    workflow.add_node("backend_engineer", _node(backend_engineer, abackend_engineer))
+    workflow.add_node("infra_security_devops", _node(infra_security_devops, ainfra_security_devops))
+    workflow.add_node("governance_lead", _node(governance_lead, agovernance_lead))
+    workflow.add_node("diagrams_complete", instrument_node("diagrams_complete", diagrams_complete))
+    workflow.add_node("mkdocs_compiler", _node(mkdocs_compiler, amkdocs_compiler))
     
-    # 2. Define standard forward edges
+    # 2. Define standard forward edges.
+    # The content writers only depend on the Core Directive, so they fan out
+    # from lead_architect alongside the diagram loop instead of waiting on it.
+    # Each branch writes a disjoint set of state keys, so the parallel updates
+    # merge deterministically.
     workflow.add_edge(START, "lead_architect")
     workflow.add_edge("lead_architect", "visual_architect")
+    workflow.add_edge("lead_architect", "backend_engineer")
+    workflow.add_edge("lead_architect", "infra_security_devops")
+    workflow.add_edge("lead_architect", "governance_lead")
     workflow.add_edge("visual_architect", "diagram_validator")
     
     # 3. Conditional validation loop for Mermaid
     def route_validation(state: AgentState):
-        errors = state.get("diagram_errors", [])
-        attempts = state.get("diagram_attempts", 0)
-        
-        # If there are NO errors -> Continue to next worker
-        # OR if we tried too many times (cap at 3) -> Give up and continue anyway
-        if len(errors) == 0 or attempts >= 3:
-            return "backend_engineer"
-            
-        # If errors exist and attempts < 3, keep retrying drawing
-        return "visual_architect"
+        # Keep retrying only while some diagram is still invalid and has
+        # attempts left (cap at MAX_DIAGRAM_ATTEMPTS per diagram).
+        # Otherwise give up on the rest and leave the diagram loop.
+        if pending_diagram_keys(state):
+            return "visual_architect"
+        return "diagrams_complete"
 
     workflow.add_conditional_edges(
         "diagram_validator",
         route_validation,
         {
-            "backend_engineer": "backend_engineer",
+            "diagrams_complete": "diagrams_complete",
             "visual_architect": "visual_architect"
         }
     )
     
-    # 4. Resume the specialized chain
-    workflow.add_edge("backend_engineer", "infra_security_devops")
-    workflow.add_edge("infra_security_devops", "governance_lead")
-    workflow.add_edge("governance_lead", "mkdocs_compiler")
+    # 4. Join every branch before compiling the site.
+    # diagrams_complete only runs once the validation loop has settled, so a
+    # failing diagram_validator pass never releases the join early.
+    workflow.add_edge(
+        ["diagrams_complete", "backend_engineer", "infra_security_devops", "governance_lead"],
+        "mkdocs_compiler"
+    )
     workflow.add_edge("mkdocs_compiler", END)
     
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
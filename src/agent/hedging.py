@@ -0,0 +1,339 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional
+
+from src.utils import metrics
+
+# Hedge delay = observed p90 of the route once this many latencies are known,
+# LLM_HEDGE_AFTER_SECONDS before that.
+MIN_SAMPLES = 10
+HISTORY = 200
+HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", "30"))
+# Hedges may add at most this fraction of extra requests (one is always allowed)
+HEDGE_BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", "0.1"))
+
+# Sync calls with a deadline or hedging race on these threads. A losing request
+# cannot be interrupted mid-flight; it runs until its per-call timeout (the
+# node's remaining time) and its response is dropped. One run makes at most
+# CALLS_PER_RUN requests at once (four parallel nodes, each split in two), and
+# each may be hedged, so the pool needs CALLS_PER_RUN * 2 threads per
+# concurrent run or new requests queue behind abandoned ones while their
+# deadline runs out. Threads are only started when needed.
+CALLS_PER_RUN = 8
+MIN_THREADS = int(os.environ.get("LLM_HEDGE_THREADS", "32"))
+_pool_size = max(MIN_THREADS, CALLS_PER_RUN * 2)
+_pool = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix="llm-call")
+_pool_lock = threading.Lock()
+
+
+def configure_call_threads(concurrent_runs: int):
+    """Grows the call pool for this many runs in parallel (batch --concurrency, service --workers)."""
+    global _pool, _pool_size
+    needed = concurrent_runs * CALLS_PER_RUN * 2
+    with _pool_lock:
+        if needed > _pool_size:
+            # Requests already running on the old pool finish there
+            old, _pool, _pool_size = _pool, ThreadPoolExecutor(max_workers=needed, thread_name_prefix="llm-call"), needed
+            old.shutdown(wait=False)
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """No usable response arrived within the node's deadline."""
+
+
+class LatencyTracker:
+    """Recent successful call latencies per route."""
+
+    def __init__(self):
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(route, deque(maxlen=HISTORY)).append(seconds)
+
+    def p90(self, route: str) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(route, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[math.ceil(0.9 * len(samples)) - 1]
+
+
+class HedgeBudget:
+    """Caps hedges to a fraction of all guarded calls in this process."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET):
+        self.ratio = ratio
+        self.calls = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def note_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.hedges < max(1.0, self.ratio * self.calls):
+                self.hedges += 1
+                return True
+            return False
+
+
+LATENCIES = LatencyTracker()
+BUDGET = HedgeBudget()
+
+
+class _Abandoned(Exception):
+    """Raised inside a streamed call whose result is no longer wanted."""
+
+
+def _ignore(text: str):
+    pass
+
+
+class _StreamGate:
+    """
+    Forwards streamed text until the call that owns it returns. An abandoned
+    request (a losing primary, or one past its deadline) keeps running in the
+    background, but its text must not be published any more.
+    """
+
+    def __init__(self, on_text: Callable[[str], None]):
+        self.on_text = on_text
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str):
+        with self._lock:
+            if self.closed:
+                # Stop reading, which closes the abandoned request and frees its thread
+                raise _Abandoned()
+            self.on_text(text)
+
+    def close(self):
+        # Waits for a text callback in progress, so nothing is published after this returns
+        with self._lock:
+            self.closed = True
+
+
+class GuardedLLM:
+    """
+    A pooled chat model plus the calling route's deadline and hedging policy.
+
+    Without a deadline or hedging a call goes straight to the client. Otherwise
+    the request runs in the background; if it has not finished by the route's
+    p90 latency, a duplicate is sent (budget permitting) and the first response
+    that `accept` approves wins. The other request is cancelled. The deadline
+    counts from the start of the calling node, so every call the node makes
+    (split, reprompt, retried) shares it; if no request is usable by then,
+    LLMDeadlineExceeded is raised.
+
+    With streaming on, the primary request is streamed and each piece of text
+    is passed to `on_text` as it arrives; hedge responses are not published.
+    """
+
+    def __init__(self, client, route: str, deadline: float = 0, hedge: bool = False,
+                 max_tokens: int = 8192, streaming: bool = False, call_timeouts: bool = True):
+        self.client = client
+        self.route = route
+        self.deadline = deadline
+        self.hedge = hedge
+        self.max_tokens = max_tokens
+        self.streaming = streaming
+        # Whether the node's remaining time may be passed to the client as its request timeout
+        # (off with the response cache, whose keys include call arguments)
+        self.call_timeouts = call_timeouts
+
+    def _hedge_at(self, started: float) -> float:
+        if not self.hedge:
+            return math.inf
+        delay = LATENCIES.p90(self.route)
+        return started + (delay if delay is not None else HEDGE_AFTER_SECONDS)
+
+    def _call_kwargs(self, deadline_at: float) -> Dict[str, float]:
+        """Request timeout = the node's remaining time, so abandoned requests end near the deadline."""
+        if deadline_at == math.inf or not self.call_timeouts:
+            return {}
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            # Waited for a thread until the deadline had passed: do not send it at all
+            raise LLMDeadlineExceeded(f"No time left for '{self.route}' within its {self.deadline:g}s deadline.")
+        return {"timeout": remaining}
+
+    def _stream(self, prompt, on_text: Callable[[str], None], kwargs: Dict[str, float]):
+        """
+        Streams the response into on_text. Streams bypass the client's retry
+        policy, so any stream error falls back to the retried invoke.
+        """
+        message = None
+        try:
+            for chunk in self.client.stream(prompt, **kwargs):
+                message = chunk if message is None else message + chunk
+                on_text(chunk.text)
+        except _Abandoned:
+            raise
+        except Exception as e:
+            print(f"Streaming '{self.route}' failed ({e}); retrying without streaming.")
+            return self.client.invoke(prompt, **kwargs)
+        return message
+
+    async def _astream(self, prompt, on_text: Callable[[str], None], kwargs: Dict[str, float]):
+        message = None
+        try:
+            async for chunk in self.client.astream(prompt, **kwargs):
+                message = chunk if message is None else message + chunk
+                on_text(chunk.text)
+        except _Abandoned:
+            raise
+        except Exception as e:
+            print(f"Streaming '{self.route}' failed ({e}); retrying without streaming.")
+            return await self.client.ainvoke(prompt, **kwargs)
+        return message
+
+    def _call(self, prompt, role: str, on_text: Optional[Callable[[str], None]] = None, deadline_at: float = math.inf):
+        kwargs = self._call_kwargs(deadline_at)
+        started = time.monotonic()
+        with metrics.span("llm.request", route=self.route, role=role, streamed=bool(on_text)):
+            res = self._stream(prompt, on_text, kwargs) if on_text else self.client.invoke(prompt, **kwargs)
+        LATENCIES.record(self.route, time.monotonic() - started)
+        metrics.record_usage(res)
+        return res
+
+    async def _acall(self, prompt, role: str, on_text: Optional[Callable[[str], None]] = None, deadline_at: float = math.inf):
+        kwargs = self._call_kwargs(deadline_at)
+        started = time.monotonic()
+        with metrics.span("llm.request", route=self.route, role=role, streamed=bool(on_text)):
+            res = await (self._astream(prompt, on_text, kwargs) if on_text else self.client.ainvoke(prompt, **kwargs))
+        LATENCIES.record(self.route, time.monotonic() - started)
+        metrics.record_usage(res)
+        return res
+
+    def _deadline_at(self, now: float) -> float:
+        if not self.deadline:
+            return math.inf
+        # Outside an instrumented node (e.g. --regenerate) the deadline applies per call
+        return (metrics.node_started() or now) + self.deadline
+
+    def _on_winner(self, role: str):
+        if role == "hedge":
+            metrics.incr("llm.hedges_won")
+
+    def _on_timeout(self, fallback):
+        if fallback is not None:
+            return fallback
+        metrics.incr("llm.deadline_exceeded")
+        raise LLMDeadlineExceeded(f"No response for '{self.route}' within its {self.deadline:g}s deadline.")
+
+    def _should_hedge(self) -> bool:
+        if BUDGET.try_spend():
+            metrics.incr("llm.hedges_sent")
+            print(f"Hedging slow '{self.route}' request.")
+            return True
+        metrics.incr("llm.hedges_over_budget")
+        return False
+
+    def invoke(self, prompt, accept: Optional[Callable[[Any], bool]] = None, on_text: Optional[Callable[[str], None]] = None):
+        BUDGET.note_call()
+        on_text = on_text if self.streaming else None
+        if not self.deadline and not self.hedge:
+            return self._call(prompt, "primary", on_text)
+
+        started = time.monotonic()
+        deadline_at = self._deadline_at(started)
+        if started >= deadline_at:
+            return self._on_timeout(None)
+        hedge_at = self._hedge_at(started)
+        call = metrics.in_current_context(self._call)
+        # With streaming, every request reads through a gate so an abandoned one stops
+        # at its next chunk instead of holding a pool thread until it completes
+        gates = []
+        def _submit(role: str, on_text=None):
+            gate = _StreamGate(on_text or _ignore) if self.streaming else None
+            if gate is not None:
+                gates.append(gate)
+            return _pool.submit(call, prompt, role, gate, deadline_at)
+        pending = {_submit("primary", on_text): "primary"}
+        fallback, error = None, None
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    return self._on_timeout(fallback)
+                if now >= hedge_at:
+                    hedge_at = math.inf
+                    if self._should_hedge():
+                        pending[_submit("hedge")] = "hedge"
+                wake = min(deadline_at, hedge_at)
+                done, _ = wait(list(pending), timeout=None if wake == math.inf else max(0.0, wake - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    role = pending.pop(future)
+                    try:
+                        res = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    if accept is None or accept(res):
+                        self._on_winner(role)
+                        return res
+                    # Not schema-conforming: keep it only in case nothing better arrives
+                    fallback = fallback or res
+        finally:
+            for future in pending:
+                future.cancel()
+            for gate in gates:
+                gate.close()
+        if fallback is not None:
+            return fallback
+        raise error
+
+    async def ainvoke(self, prompt, accept: Optional[Callable[[Any], bool]] = None, on_text: Optional[Callable[[str], None]] = None):
+        BUDGET.note_call()
+        on_text = on_text if self.streaming else None
+        if not self.deadline and not self.hedge:
+            return await self._acall(prompt, "primary", on_text)
+
+        started = time.monotonic()
+        deadline_at = self._deadline_at(started)
+        if started >= deadline_at:
+            return self._on_timeout(None)
+        hedge_at = self._hedge_at(started)
+        gate = _StreamGate(on_text) if on_text else None
+        pending = {asyncio.ensure_future(self._acall(prompt, "primary", gate, deadline_at)): "primary"}
+        fallback, error = None, None
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    return self._on_timeout(fallback)
+                if now >= hedge_at:
+                    hedge_at = math.inf
+                    if self._should_hedge():
+                        pending[asyncio.ensure_future(self._acall(prompt, "hedge", None, deadline_at))] = "hedge"
+                wake = min(deadline_at, hedge_at)
+                done, _ = await asyncio.wait(list(pending), timeout=None if wake == math.inf else max(0.0, wake - now), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    role = pending.pop(task)
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    res = task.result()
+                    if accept is None or accept(res):
+                        self._on_winner(role)
+                        return res
+                    fallback = fallback or res
+        finally:
+            # Unlike threads, tasks can be cancelled, which aborts the loser's HTTP request
+            for task in pending:
+                task.cancel()
+            if gate is not None:
+                gate.close()
+        if fallback is not None:
+            return fallback
+        raise error
@@ -1,17 +1,177 @@
+import json
 import os
+import threading
+from typing import Any, Dict, Tuple
+
+import httpx
+from langchain_core.exceptions import ModelAPIError, ModelConnectionError, ModelRateLimitError, ModelTimeoutError
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-def get_llm():
-    """Initializes and returns the Gemini LLM."""
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key or api_key == "your_gemini_api_key_here":
-        raise ValueError("GEMINI_API_KEY environment variable is not set correctly.")
-    
-    # Using gemini-2.5-pro or gemini-2.5-flash for complex tasks
-    # Ensure google-genai supports this model version
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash", 
-        temperature=0.2, # Low temperature for more deterministic standard docs
-        max_tokens=8192,
+from src.agent.fake_llm import FakeChatModel
+from src.agent.hedging import GuardedLLM
+from src.agent.llm_cache import get_response_cache
+from src.agent.rate_limit import TokenUsageRecorder, get_rate_limiter
+
+DEFAULT_CONFIG = {
+    "model": os.environ.get("LLM_MODEL", "gemini-2.5-flash"),
+    "temperature": 0.2,  # Low temperature for more deterministic standard docs
+    "max_tokens": 8192,
+    "timeout": float(os.environ.get("LLM_TIMEOUT_SECONDS", "120")),
+    "max_attempts": int(os.environ.get("LLM_MAX_ATTEMPTS", "3")),
+    # Call policy (see hedging.GuardedLLM); 0 / false disables
+    "deadline": float(os.environ.get("LLM_DEADLINE_SECONDS", "0")),
+    "hedge": os.environ.get("LLM_HEDGE", "0") == "1",
+    # Stream responses so fields can be used as soon as they are complete
+    "stream": os.environ.get("LLM_STREAM", "1") == "1",
+}
+# Settings that need their own client; the rest only change how it is called
+CLIENT_SETTINGS = ("model", "temperature", "max_tokens", "timeout", "max_attempts")
+
+# Errors another attempt can fix: quota, server-side and network failures.
+# Bad requests, auth errors and replay cache misses fail immediately.
+RETRYABLE_ERRORS = (
+    ModelRateLimitError,
+    ModelConnectionError,
+    ModelTimeoutError,
+    ModelAPIError,
+    TimeoutError,
+    ConnectionError,
+    httpx.TransportError,
+)
+
+_clients: Dict[Tuple, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _load_node_config() -> Dict[str, Dict[str, Any]]:
+    """
+    Per-node settings from LLM_NODE_CONFIG, either inline JSON or a path to a
+    JSON file, read once at import, e.g. {"lead_architect": {"model": "gemini-2.5-pro"},
+    "visual_architect_retry": {"model": "gemini-2.5-flash-lite", "temperature": 0}}.
+    A "default" entry applies to every node.
+    """
+    raw = os.environ.get("LLM_NODE_CONFIG", "").strip()
+    if not raw:
+        return {}
+    if not raw.startswith("{"):
+        try:
+            with open(raw, encoding="utf-8") as f:
+                raw = f.read()
+        except OSError as e:
+            raise ValueError(f"LLM_NODE_CONFIG file cannot be read: {e}")
+    try:
+        overrides = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"LLM_NODE_CONFIG is not valid JSON: {e}")
+    unknown = {key for entry in overrides.values() for key in entry} - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"LLM_NODE_CONFIG has unknown settings {sorted(unknown)}; expected {sorted(DEFAULT_CONFIG)}.")
+    return overrides
+
+
+# Parsed at startup, so a bad LLM_NODE_CONFIG fails immediately rather than on the first node call
+NODE_CONFIG = _load_node_config()
+
+
+def resolve_llm_config(route: str) -> Dict[str, Any]:
+    """
+    Settings for a route: defaults, then "default", then the node, then the
+    route itself (e.g. visual_architect_retry falls back to visual_architect).
+    """
+    config = dict(DEFAULT_CONFIG)
+    config.update(NODE_CONFIG.get("default", {}))
+    if route.endswith("_retry"):
+        config.update(NODE_CONFIG.get(route[:-len("_retry")], {}))
+    config.update(NODE_CONFIG.get(route, {}))
+    return config
+
+
+def _backend_settings() -> Tuple:
+    backend = os.environ.get("LLM_BACKEND", "gemini")
+    if backend == "fake":
+        return (
+            backend,
+            float(os.environ.get("FAKE_LLM_LATENCY_MS", "0")) / 1000,
+            os.environ.get("FAKE_LLM_MERMAID", "valid"),
+            os.environ.get("FAKE_LLM_JSON", "clean"),
+        )
+    return (backend,)
+
+
+def _build_client(config: Dict[str, Any], backend: Tuple, cache, limiter):
+    callbacks = [TokenUsageRecorder(limiter)] if limiter else None
+
+    if backend[0] == "fake":
+        _, latency_seconds, mermaid_mode, json_mode = backend
+        llm = FakeChatModel(
+            model=f"fake-{config['model']}",
+            temperature=config["temperature"],
+            max_tokens=config["max_tokens"],
+            latency_seconds=latency_seconds,
+            mermaid_mode=mermaid_mode,
+            json_mode=json_mode,
+            cache=cache,
+            rate_limiter=limiter,
+            callbacks=callbacks,
+        )
+    else:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key or api_key == "your_gemini_api_key_here":
+            raise ValueError("GEMINI_API_KEY environment variable is not set correctly.")
+
+        llm = ChatGoogleGenerativeAI(
+            model=config["model"],
+            temperature=config["temperature"],
+            max_tokens=config["max_tokens"],
+            timeout=config["timeout"],
+            # Retries happen below, with jitter, so concurrent runs do not retry in lockstep
+            max_retries=0,
+            cache=cache,
+            rate_limiter=limiter,
+            callbacks=callbacks,
+        )
+
+    return llm.with_retry(
+        retry_if_exception_type=RETRYABLE_ERRORS,
+        wait_exponential_jitter=True,
+        stop_after_attempt=max(1, int(config["max_attempts"])),
+    )
+
+
+def get_llm(route: str = "default"):
+    """
+    Returns the shared chat model for a node (or a route such as
+    visual_architect_retry), creating it on first use, wrapped with the
+    route's deadline and hedging policy.
+    Clients are pooled per resolved configuration, so nodes and concurrent runs
+    that use the same settings share one client and its open connections.
+    LLM_BACKEND=fake selects the deterministic offline model (no API key needed);
+    LLM_CACHE_MODE=record|replay puts the on-disk response cache in front of it,
+    and LLM_RPM / LLM_TPM (or configure_rate_limiter) throttle real requests.
+    Streaming is turned off while the response cache is in use, since cached
+    responses are only looked up and stored for whole calls.
+    """
+    config = resolve_llm_config(route)
+    # An explicit False keeps any globally configured LangChain cache out of passthrough runs
+    cache = get_response_cache() or False
+    limiter = get_rate_limiter()
+    backend = _backend_settings()
+    key = (
+        backend,
+        tuple(config[name] for name in CLIENT_SETTINGS),
+        id(cache) if cache else None,
+        id(limiter) if limiter else None,
+    )
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _build_client(config, backend, cache, limiter)
+    return GuardedLLM(
+        client,
+        route,
+        deadline=float(config["deadline"]),
+        hedge=bool(config["hedge"]),
+        max_tokens=int(config["max_tokens"]),
+        streaming=bool(config["stream"]) and not cache,
+        call_timeouts=not cache,
     )
-    return llm
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+CACHE_MODES = ("passthrough", "record", "replay")
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when a prompt has no recorded response."""
+
+
+def _dump_generations(generations: Sequence[Generation]) -> str:
+    items = []
+    for gen in generations:
+        if isinstance(gen, ChatGeneration):
+            items.append({"message": message_to_dict(gen.message), "info": gen.generation_info})
+        else:
+            items.append({"text": gen.text, "info": gen.generation_info})
+    return json.dumps(items, ensure_ascii=False)
+
+
+def _load_generations(payload: str) -> Sequence[Generation]:
+    generations = []
+    for item in json.loads(payload):
+        if "message" in item:
+            (message,) = messages_from_dict([item["message"]])
+            generations.append(ChatGeneration(message=message, generation_info=item.get("info")))
+        else:
+            generations.append(Generation(text=item["text"], generation_info=item.get("info")))
+    return generations
+
+
+class LLMResponseCache(BaseCache):
+    """
+    On-disk record/replay cache for chat model responses.
+
+    LangChain calls lookup/update with the fully rendered prompt and an
+    llm_string describing the model parameters (model name, temperature,
+    max_tokens, ...), so both are part of the key. Entries expire after
+    ttl_seconds and the least recently used ones are evicted once the stored
+    responses exceed max_bytes.
+
+    Modes:
+      record      - serve hits, call the model on a miss and store the result
+      replay      - serve hits, raise LLMCacheMiss on a miss (no API calls)
+    The third mode, passthrough, simply runs without a cache.
+    """
+
+    def __init__(self, path: str, mode: str = "record", ttl_seconds: float = 7 * 24 * 3600, max_bytes: int = 512 * 1024 * 1024):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unsupported LLM cache mode for LLMResponseCache: '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+
+        if row is None:
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"No recorded LLM response for prompt {key[:12]} (LLM_CACHE_MODE=replay).")
+            return None
+        return _load_generations(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        payload = _dump_generations(return_val)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, payload, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (self._key(prompt, llm_string), payload, len(payload), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """
+    Returns the process-wide response cache configured by LLM_CACHE_MODE,
+    or None in passthrough mode.
+    """
+    global _cache
+    mode = os.environ.get("LLM_CACHE_MODE", "passthrough")
+    if mode not in CACHE_MODES:
+        raise ValueError(f"LLM_CACHE_MODE must be one of {', '.join(CACHE_MODES)}, got '{mode}'.")
+    if mode == "passthrough":
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.mode != mode:
+            _cache = LLMResponseCache(
+                path=os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite")),
+                mode=mode,
+                ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+                max_bytes=int(float(os.environ.get("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+            )
+        return _cache
@@ -1,12 +1,30 @@
+import asyncio
 import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from pydantic import BaseModel, Field
-import json
+from langgraph.config import get_stream_writer
+from pydantic import BaseModel, Field, create_model
+from typing import Dict, List, Type
 
-from src.agent.state import AgentState
+from src.agent.state import STATE_FILENAME, AgentState, save_state
+from src.agent.budget import (
+    OUTPUT_HEADROOM,
+    estimate_output_tokens,
+    estimate_tokens,
+    format_instructions,
+    output_budget,
+    split_fields
+)
 from src.agent.llm import get_llm
-from src.utils.mermaid import validate_mermaid_syntax
+from src.utils.mermaid import avalidate_mermaid_batch, render_mermaid_svg, validate_mermaid_batch
+from src.utils.mermaid_cache import get_validation_cache
+from src.utils.json_repair import count_recovery, repair_json_object
+from src.utils import metrics
+from src.utils.json_stream import JsonFieldStream
+from src.utils.site_writer import atomic_write, build_site, prune_dir, write_site
 
 # --- Output Schemas ---
 class ArchitectOutput(BaseModel):
@@ -41,39 +59,226 @@ class GovernanceOutput(BaseModel):
     p7_when_not_to_use: str = Field(description="Markdown When NOT to Use")
 
 
-def _run_agent_with_fallback(llm, prompt_template, parser, input_vars):
-    """Helper to run the chain and natively fallback to basic JSON parsing if Gemini injects ticks."""
-    chain = prompt_template | llm | parser
-    try:
-        return chain.invoke(input_vars)
-    except Exception as e:
-        print(f"Primary parsing failed: {e}. Retrying raw invoke...")
-        res = llm.invoke(prompt_template.format_prompt(**input_vars))
+# Diagram keys produced by visual_architect and their labels in error messages
+DIAGRAM_LABELS = {
+    "p1_overview_architecture_mermaid": "P1 Arch",
+    "p1_overview_flow_mermaid": "P1 Flow",
+    "p2_deep_architecture_mermaid": "P2 Arch",
+    "p2_deep_flow_mermaid": "P2 Flow",
+}
+DIAGRAM_KEYS = list(DIAGRAM_LABELS)
+MAX_DIAGRAM_ATTEMPTS = 3
+# Fields previewed while nodes are still running; removed once the site is written
+PARTIAL_DIR = ".partial"
+# Pre-rendered diagrams, relative to docs/
+DIAGRAM_ASSETS_DIR = "assets/diagrams"
+
+def pending_diagram_keys(state: AgentState) -> List[str]:
+    """Diagrams that are not valid yet and have not used up their attempts."""
+    valid = state.get("valid_diagrams", [])
+    attempts = state.get("diagram_key_attempts", {})
+    return [k for k in DIAGRAM_KEYS if k not in valid and attempts.get(k, 0) < MAX_DIAGRAM_ATTEMPTS]
+
+def _schema_subset(model: Type[BaseModel], fields: List[str]) -> Type[BaseModel]:
+    """Builds a copy of an output schema restricted to the given fields."""
+    if set(fields) == set(model.model_fields):
+        return model
+    return create_model(
+        f"{model.__name__}Subset",
+        **{name: (info.annotation, info) for name, info in model.model_fields.items() if name in fields}
+    )
+
+def _message_text(message) -> str:
+    """Plain text of a model response, whether content is a string or a list of parts."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+def _parse_agent_output(text: str, model: Type[BaseModel]):
+    """
+    Repairs the raw response locally and checks it against the output schema.
+    Returns (fields, missing, partial): usable fields, fields that must be
+    requested again, and cut-off values kept as a last resort.
+    """
+    data, stage, cut_key = repair_json_object(text)
+    if stage != "direct":
+        print(f"Model output needed local JSON recovery ({stage}).")
+    data = data or {}
+
+    fields, missing, partial = {}, [], {}
+    for name in model.model_fields:
+        value = data.get(name)
+        if isinstance(value, list):
+            # Models sometimes answer bullet-point fields with a JSON list
+            value = "\n".join(f"- {item}" for item in value)
+        if not isinstance(value, str) or not value.strip():
+            missing.append(name)
+        elif name == cut_key:
+            missing.append(name)
+            partial[name] = value
+        else:
+            fields[name] = value
+    return fields, missing, partial
+
+def _render_prompt(prompt_template, input_vars, model: Type[BaseModel]):
+    """Renders the node's prompt, asking only for the fields of the given (sub)schema."""
+    return prompt_template.format_prompt(**{**input_vars, "format_instructions": format_instructions(model)})
+
+def _finalize_agent_output(model: Type[BaseModel], result, missing: List[str], partial):
+    if missing:
+        print(f"Could not recover fields {missing}. Using partial or empty values.")
+        count_recovery("unrecovered_fields", len(missing))
+    for name in missing:
+        result[name] = partial.get(name, "")
+    return model.model_validate(result).model_dump()
+
+def _accepts(model: Type[BaseModel]):
+    """Whether a response carries every field of the schema; decides hedged races."""
+    def _check(res) -> bool:
+        data, _, cut_key = repair_json_object(_message_text(res), record=False)
+        return bool(data) and cut_key is None and all(data.get(name) for name in model.model_fields)
+    return _check
+
+def _field_sink(state: AgentState):
+    """
+    Publishes each field as soon as its value has streamed in: written to
+    <output_dir>/.partial/<field>.md and sent as a custom graph stream event.
+    The field reaches AgentState when the node returns.
+    """
+    partial_dir = os.path.join(state.get("output_dir") or "output", PARTIAL_DIR)
+
+    def _publish(name: str, value):
+        if not isinstance(value, str) or not value.strip():
+            return
+        atomic_write(os.path.join(partial_dir, f"{name}.md"), value)
+        print(f"Field ready: {name}")
         try:
-            return parser.invoke(res)
-        except Exception as e2:
-            print(f"Fallback parsing failed: {e2}. Attempting manual extract.")
-            text = res.content.strip()
-            # Try to find the start and end of a JSON object
-            import re
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                try:
-                    return json.loads(json_match.group(0))
-                except json.JSONDecodeError as je:
-                    print(f"Critical Parsing Failure: {je}")
-            
-            print("Could not locate valid JSON in response. Returning mapping of empty strings.")
-            # Return a dict with empty strings for expected keys based on the Pydantic model
-            if hasattr(parser, 'pydantic_object'):
-                 return {k: "" for k in parser.pydantic_object.__fields__.keys()}
-            return {}
+            get_stream_writer()({"field": name})
+        except Exception:
+            pass  # Not running inside a graph (e.g. --regenerate)
+    return _publish
+
+def discard_partial(output_dir: str):
+    """Removes the field previews of a run, once the site is written or the run has failed."""
+    shutil.rmtree(os.path.join(output_dir or "output", PARTIAL_DIR), ignore_errors=True)
+
+def _streamed(on_field):
+    """
+    Feeds streamed text through an incremental JSON parser into on_field.
+    Returns (on_text, settle): settle(fields) then publishes the parsed values
+    the stream did not deliver as-is, e.g. after a hedge won or a failed
+    stream was retried without streaming.
+    """
+    if on_field is None:
+        return None, lambda fields: None
+    stream = JsonFieldStream()
+    published = {}
+    def _publish(name: str, value):
+        published[name] = value
+        on_field(name, value)
+    def _on_text(text: str):
+        for name, value in stream.feed(text):
+            _publish(name, value)
+    def _settle(fields):
+        for name, value in fields.items():
+            if published.get(name) != value:
+                _publish(name, value)
+    return _on_text, _settle
+
+def _call_plan(llm, model: Type[BaseModel]) -> List[List[str]]:
+    """Splits the schema into concurrent calls if one answer would not fit in the output budget."""
+    fields = list(model.model_fields)
+    groups = split_fields(fields, llm.max_tokens)
+    if len(groups) > 1:
+        print(
+            f"Expected output of ~{estimate_output_tokens(fields)} tokens exceeds the budget of "
+            f"{output_budget(llm.max_tokens)} ({OUTPUT_HEADROOM:.0%} of max_tokens={llm.max_tokens}); "
+            f"splitting into {len(groups)} concurrent calls."
+        )
+        metrics.incr("llm.split_calls", len(groups))
+    return groups
+
+def _call_estimates(prompt, model: Type[BaseModel]) -> Dict[str, int]:
+    return {
+        "prompt_tokens_est": estimate_tokens(prompt.to_string()),
+        "output_tokens_est": estimate_output_tokens(list(model.model_fields)),
+    }
+
+def _agent_call(llm, prompt_template, input_vars, model: Type[BaseModel], attempt: str, on_field=None):
+    """One timed model call for a (sub)schema, subject to the route's deadline and hedging."""
+    prompt = _render_prompt(prompt_template, input_vars, model)
+    on_text, settle = _streamed(on_field)
+    with metrics.span("llm", attempt=attempt, **_call_estimates(prompt, model)):
+        res = llm.invoke(prompt, accept=_accepts(model), on_text=on_text)
+    fields, missing, partial = _parse_agent_output(_message_text(res), model)
+    settle(fields)
+    return fields, missing, partial
+
+async def _aagent_call(llm, prompt_template, input_vars, model: Type[BaseModel], attempt: str, on_field=None):
+    prompt = _render_prompt(prompt_template, input_vars, model)
+    on_text, settle = _streamed(on_field)
+    with metrics.span("llm", attempt=attempt, **_call_estimates(prompt, model)):
+        res = await llm.ainvoke(prompt, accept=_accepts(model), on_text=on_text)
+    fields, missing, partial = _parse_agent_output(_message_text(res), model)
+    settle(fields)
+    return fields, missing, partial
+
+def _merge_parts(parts):
+    result, missing, partial = {}, [], {}
+    for fields, part_missing, part_partial in parts:
+        result.update(fields)
+        missing.extend(part_missing)
+        partial.update(part_partial)
+    return result, missing, partial
+
+def _run_agent_with_fallback(llm, prompt_template, parser, input_vars, on_field=None):
+    """
+    Runs the agent and repairs its JSON locally. Schemas too large for one
+    answer are split into concurrent calls. Only fields that cannot be
+    recovered from the responses are requested again, in one smaller call.
+    """
+    model = parser.pydantic_object
+    groups = _call_plan(llm, model)
+    if len(groups) == 1:
+        result, missing, partial = _agent_call(llm, prompt_template, input_vars, model, "initial", on_field)
+    else:
+        call = metrics.in_current_context(
+            lambda fields: _agent_call(llm, prompt_template, input_vars, _schema_subset(model, fields), "split", on_field)
+        )
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            result, missing, partial = _merge_parts(pool.map(call, groups))
+    if missing:
+        print(f"Re-prompting for missing fields only: {missing}")
+        count_recovery("reprompt")
+        extra, missing, extra_partial = _agent_call(llm, prompt_template, input_vars, _schema_subset(model, missing), "reprompt", on_field)
+        result.update(extra)
+        partial.update(extra_partial)
+    return _finalize_agent_output(model, result, missing, partial)
+
+async def _arun_agent_with_fallback(llm, prompt_template, parser, input_vars, on_field=None):
+    """Async twin of _run_agent_with_fallback, so network waits can overlap on one event loop."""
+    model = parser.pydantic_object
+    groups = _call_plan(llm, model)
+    if len(groups) == 1:
+        result, missing, partial = await _aagent_call(llm, prompt_template, input_vars, model, "initial", on_field)
+    else:
+        parts = await asyncio.gather(*(
+            _aagent_call(llm, prompt_template, input_vars, _schema_subset(model, fields), "split", on_field) for fields in groups
+        ))
+        result, missing, partial = _merge_parts(parts)
+    if missing:
+        print(f"Re-prompting for missing fields only: {missing}")
+        count_recovery("reprompt")
+        extra, missing, extra_partial = await _aagent_call(llm, prompt_template, input_vars, _schema_subset(model, missing), "reprompt", on_field)
+        result.update(extra)
+        partial.update(extra_partial)
+    return _finalize_agent_output(model, result, missing, partial)
 
 # --- Nodes ---
 
-def lead_architect(state: AgentState):
-    print(f"--- NODE: lead_architect ---")
-    llm = get_llm()
+def _lead_architect_call(state: AgentState):
+    llm = get_llm("lead_architect")
     parser = JsonOutputParser(pydantic_object=ArchitectOutput)
     
     desc = f"\nUser Requirements:\n{state.get('framework_description', '')}" if state.get('framework_description') else ""
@@ -82,71 +287,143 @@ def lead_architect(state: AgentState):
         ("human", "Framework Topic: {framework_name}{desc}")
     ])
     
-    result = _run_agent_with_fallback(llm, prompt, parser, {
+    return llm, prompt, parser, {
         "framework_name": state["framework_name"],
         "desc": desc,
-        "format_instructions": parser.get_format_instructions()
-    })
-    return result
+        "format_instructions": format_instructions(parser.pydantic_object)
+    }
+
+def lead_architect(state: AgentState):
+    print(f"--- NODE: lead_architect ---")
+    return _run_agent_with_fallback(*_lead_architect_call(state), on_field=_field_sink(state))
+
+async def alead_architect(state: AgentState):
+    print(f"--- NODE: lead_architect ---")
+    return await _arun_agent_with_fallback(*_lead_architect_call(state), on_field=_field_sink(state))
+
+def _visual_architect_call(state: AgentState):
+    # Retries only redraw the failed diagrams, so they may use a cheaper/faster route
+    retry = bool(state.get("diagram_key_attempts"))
+    llm = get_llm("visual_architect_retry" if retry else "visual_architect")
+
+    # Only (re)draw diagrams that are not yet valid and still have attempts left
+    pending = pending_diagram_keys(state)
+    key_errors = state.get("diagram_key_errors", {})
+    parser = JsonOutputParser(pydantic_object=_schema_subset(VisualArchitectOutput, pending))
+
+    if len(pending) == len(DIAGRAM_KEYS):
+        task = f"Generate exactly {len(pending)} valid, complex Mermaid.js diagrams based strictly on the Core Directive."
+    else:
+        task = f"Regenerate only the {len(pending)} Mermaid.js diagram(s) requested below based strictly on the Core Directive. The other diagrams are already valid."
 
-def visual_architect(state: AgentState):
-    print(f"--- NODE: visual_architect ---")
-    llm = get_llm()
-    parser = JsonOutputParser(pydantic_object=VisualArchitectOutput)
-    
     error_msg = ""
-    if state.get("diagram_errors"):
-        error_msg = f"Previous attempts failed with these errors:\n{state['diagram_errors'][-1]}\n\nPlease fix your Mermaid syntax."
+    failed = [k for k in pending if key_errors.get(k)]
+    if failed:
+        details = "\n\n".join(f"{DIAGRAM_LABELS[k]} Diagram Error:\n{key_errors[k]}" for k in failed)
+        error_msg = f"Previous attempts failed with these errors:\n{details}\n\nPlease fix your Mermaid syntax."
         
     prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are the Visual Architect Specialist. Generate exactly 4 valid, complex Mermaid.js diagrams based strictly on the Core Directive. DO NOT wrap the mermaid code in markdown backticks inside the JSON.\n\n{format_instructions}"),
+        ("system", "You are the Visual Architect Specialist. {task} DO NOT wrap the mermaid code in markdown backticks inside the JSON.\n\n{format_instructions}"),
         ("human", "Core Directive:\n{core_directive}\n\n{error_msg}")
     ])
     
-    result = _run_agent_with_fallback(llm, prompt, parser, {
+    return llm, prompt, parser, {
+        "task": task,
         "core_directive": state.get("core_concept_directive", ""),
         "error_msg": error_msg,
-        "format_instructions": parser.get_format_instructions()
-    })
+        "format_instructions": format_instructions(parser.pydantic_object)
+    }
+
+def _visual_architect_update(state: AgentState, result):
+    pending = pending_diagram_keys(state)
+    # Never let a retry overwrite a diagram that has already been validated
+    result = {k: v for k, v in result.items() if k in pending}
     
     # Strip backticks just in case
     for key in result:
-        val = result[key].strip()
+        val = str(result[key]).strip()
         if val.startswith("```mermaid"): val = val[10:]
         elif val.startswith("```"): val = val[3:]
         if val.endswith("```"): val = val[:-3]
         result[key] = val.strip()
-        
+
+    key_attempts = dict(state.get("diagram_key_attempts", {}))
+    for key in pending:
+        key_attempts[key] = key_attempts.get(key, 0) + 1
+        metrics.incr(f"diagram_attempts.{key}")
+
+    result["diagrams_pending"] = pending
+    result["diagram_key_attempts"] = key_attempts
     result["diagram_attempts"] = state.get("diagram_attempts", 0) + 1
     return result
 
-def diagram_validator(state: AgentState):
-    print(f"--- NODE: diagram_validator ---")
-    
+def visual_architect(state: AgentState):
+    print(f"--- NODE: visual_architect ---")
+    result = _run_agent_with_fallback(*_visual_architect_call(state), on_field=_field_sink(state))
+    return _visual_architect_update(state, result)
+
+async def avisual_architect(state: AgentState):
+    print(f"--- NODE: visual_architect ---")
+    result = await _arun_agent_with_fallback(*_visual_architect_call(state), on_field=_field_sink(state))
+    return _visual_architect_update(state, result)
+
+def _diagrams_to_check(state: AgentState):
+    # Revalidate only the diagrams visual_architect just (re)generated
+    pending = state.get("diagrams_pending", DIAGRAM_KEYS)
+    return {key: state.get(key, "") for key in pending}
+
+def _diagram_validator_update(state: AgentState, results):
+    valid = list(state.get("valid_diagrams", []))
+    key_errors = dict(state.get("diagram_key_errors", {}))
     errors = []
-    diagrams_to_check = {
-        "P1 Arch": state.get("p1_overview_architecture_mermaid", ""),
-        "P1 Flow": state.get("p1_overview_flow_mermaid", ""),
-        "P2 Arch": state.get("p2_deep_architecture_mermaid", ""),
-        "P2 Flow": state.get("p2_deep_flow_mermaid", "")
-    }
-    
-    for name, code in diagrams_to_check.items():
-        err = validate_mermaid_syntax(code)
-        if err: errors.append(f"{name} Diagram Error:\n{err}")
+    for key, err in results.items():
+        if err:
+            key_errors[key] = err
+            errors.append(f"{DIAGRAM_LABELS[key]} Diagram Error:\n{err}")
+        else:
+            key_errors.pop(key, None)
+            if key not in valid:
+                valid.append(key)
+
+    cache = get_validation_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Mermaid validation cache: {stats['hits']} hits, {stats['misses']} misses")
     
-    existing_errors = state.get("diagram_errors", [])
+    # Copy rather than append in place: the writer branches run concurrently
+    # and must never observe a mutated state object.
+    existing_errors = list(state.get("diagram_errors", []))
     if errors:
         existing_errors.append("\n\n".join(errors))
-        print("Validation Failed. Routing back to visual_architect.")
+        print(f"Validation Failed for {len(errors)} diagram(s).")
     else:
         print("Validation Passed!")
         
-    return {"diagram_errors": existing_errors}
+    return {
+        "diagram_errors": existing_errors,
+        "valid_diagrams": valid,
+        "diagram_key_errors": key_errors,
+        "diagrams_pending": [],
+    }
 
-def backend_engineer(state: AgentState):
-    print(f"--- NODE: backend_engineer ---")
-    llm = get_llm()
+def diagram_validator(state: AgentState):
+    print(f"--- NODE: diagram_validator ---")
+    # The pending diagrams are rendered concurrently by the shared Mermaid worker
+    results = validate_mermaid_batch(_diagrams_to_check(state))
+    return _diagram_validator_update(state, results)
+
+async def adiagram_validator(state: AgentState):
+    print(f"--- NODE: diagram_validator ---")
+    results = await avalidate_mermaid_batch(_diagrams_to_check(state))
+    return _diagram_validator_update(state, results)
+
+def diagrams_complete(state: AgentState):
+    """Marks the end of the diagram validation loop so the compiler join can fire."""
+    print(f"--- NODE: diagrams_complete ---")
+    return {}
+
+def _backend_engineer_call(state: AgentState):
+    llm = get_llm("backend_engineer")
     parser = JsonOutputParser(pydantic_object=BackendEngineerOutput)
     
     prompt = ChatPromptTemplate.from_messages([
@@ -154,16 +431,22 @@ def backend_engineer(state: AgentState):
         ("human", "Framework: {framework_name}\nCore Directive:\n{core_directive}")
     ])
     
-    result = _run_agent_with_fallback(llm, prompt, parser, {
+    return llm, prompt, parser, {
         "framework_name": state["framework_name"],
         "core_directive": state.get("core_concept_directive", ""),
-        "format_instructions": parser.get_format_instructions()
-    })
-    return result
+        "format_instructions": format_instructions(parser.pydantic_object)
+    }
 
-def infra_security_devops(state: AgentState):
-    print(f"--- NODE: infra_security_devops ---")
-    llm = get_llm()
+def backend_engineer(state: AgentState):
+    print(f"--- NODE: backend_engineer ---")
+    return _run_agent_with_fallback(*_backend_engineer_call(state), on_field=_field_sink(state))
+
+async def abackend_engineer(state: AgentState):
+    print(f"--- NODE: backend_engineer ---")
+    return await _arun_agent_with_fallback(*_backend_engineer_call(state), on_field=_field_sink(state))
+
+def _infra_security_devops_call(state: AgentState):
+    llm = get_llm("infra_security_devops")
     parser = JsonOutputParser(pydantic_object=InfraDevOpsOutput)
     
     prompt = ChatPromptTemplate.from_messages([
@@ -171,16 +454,22 @@ def infra_security_devops(state: AgentState):
         ("human", "Framework: {framework_name}\nCore Directive:\n{core_directive}")
     ])
     
-    result = _run_agent_with_fallback(llm, prompt, parser, {
+    return llm, prompt, parser, {
         "framework_name": state["framework_name"],
         "core_directive": state.get("core_concept_directive", ""),
-        "format_instructions": parser.get_format_instructions()
-    })
-    return result
+        "format_instructions": format_instructions(parser.pydantic_object)
+    }
 
-def governance_lead(state: AgentState):
-    print(f"--- NODE: governance_lead ---")
-    llm = get_llm()
+def infra_security_devops(state: AgentState):
+    print(f"--- NODE: infra_security_devops ---")
+    return _run_agent_with_fallback(*_infra_security_devops_call(state), on_field=_field_sink(state))
+
+async def ainfra_security_devops(state: AgentState):
+    print(f"--- NODE: infra_security_devops ---")
+    return await _arun_agent_with_fallback(*_infra_security_devops_call(state), on_field=_field_sink(state))
+
+def _governance_lead_call(state: AgentState):
+    llm = get_llm("governance_lead")
     parser = JsonOutputParser(pydantic_object=GovernanceOutput)
     
     prompt = ChatPromptTemplate.from_messages([
@@ -188,35 +477,77 @@ def governance_lead(state: AgentState):
         ("human", "Framework: {framework_name}\nCore Directive:\n{core_directive}")
     ])
     
-    result = _run_agent_with_fallback(llm, prompt, parser, {
+    return llm, prompt, parser, {
         "framework_name": state["framework_name"],
         "core_directive": state.get("core_concept_directive", ""),
-        "format_instructions": parser.get_format_instructions()
-    })
-    return result
+        "format_instructions": format_instructions(parser.pydantic_object)
+    }
 
-def mkdocs_compiler(state: AgentState):
-    print(f"--- NODE: mkdocs_compiler ---")
-    
-    output_dir = "output"
-    docs_dir = os.path.join(output_dir, "docs")
-    os.makedirs(docs_dir, exist_ok=True)
-    
+def governance_lead(state: AgentState):
+    print(f"--- NODE: governance_lead ---")
+    return _run_agent_with_fallback(*_governance_lead_call(state), on_field=_field_sink(state))
+
+async def agovernance_lead(state: AgentState):
+    print(f"--- NODE: governance_lead ---")
+    return await _arun_agent_with_fallback(*_governance_lead_call(state), on_field=_field_sink(state))
+
+def mermaid_render_mode() -> str:
+    """
+    How diagrams reach the reader (MERMAID_RENDER_MODE):
+      client - mermaid fences rendered in the browser by mermaid.js (default)
+      svg    - pre-rendered SVG files referenced as images
+      inline - pre-rendered SVG embedded in the page
+    """
+    mode = os.environ.get("MERMAID_RENDER_MODE", "client").lower()
+    return mode if mode in ("client", "svg", "inline") else "client"
+
+def _scope_svg_ids(svg: str, svg_id: str) -> str:
+    """
+    Renames the root id of an inlined SVG. Mermaid renders every diagram as
+    id="my-svg" and scopes its <style> and marker ids to it, so two diagrams on
+    one page would otherwise share styles and arrowheads.
+    """
+    match = re.search(r'<svg\b[^>]*?\bid="([^"]+)"', svg)
+    if not match:
+        return svg
+    # Also matches derived ids such as my-svg_flowchart-pointEnd, but not my-svg-other
+    return re.sub(rf"(?<![\w-]){re.escape(match.group(1))}(?![A-Za-z0-9-])", svg_id, svg)
+
+def _diagram_markdown(code: str, label: str, mode: str, assets: Dict[str, str], svg_id: str = "mermaid-svg") -> str:
+    """Markdown for one diagram; falls back to a client-side fence when no SVG is available."""
+    if mode != "client" and code:
+        svg, key = render_mermaid_svg(code)
+        if svg is not None:
+            if mode == "svg":
+                assets[f"{DIAGRAM_ASSETS_DIR}/{key}.svg"] = svg
+                return f"![{label}]({DIAGRAM_ASSETS_DIR}/{key}.svg)"
+            # Raw HTML block: drop the XML prolog and blank lines so Markdown leaves it alone
+            svg = re.sub(r"^<\?xml[^>]*\?>\s*", "", svg.strip())
+            svg = "\n".join(line for line in _scope_svg_ids(svg, svg_id).splitlines() if line.strip())
+            return f'<div class="mermaid-svg">\n{svg}\n</div>'
+    return f"```mermaid\n{code}\n```"
+
+def render_site(state: AgentState) -> Dict[str, str]:
+    """Renders every page and mkdocs.yml, keyed by path relative to the output root."""
     # Safely get variables
     def _g(key): return state.get(key, "")
 
+    mode = mermaid_render_mode()
+    assets: Dict[str, str] = {}
+    def _d(key): return _diagram_markdown(_g(key), DIAGRAM_LABELS[key], mode, assets, svg_id=f"mermaid-{key.replace('_', '-')}")
+
     # Write Markdowns mapped precisely to P1-P7
     files_map = {
          "index.md": f"# {state['framework_name']}\n\n"
                      f"## 1. Business Context\n\n### Purpose\n{_g('p1_business_purpose')}\n\n"
                      f"### What problem this solves?\n{_g('p1_problem_solved')}\n\n"
                      f"### Key characteristics\n{_g('p1_key_characteristics')}\n\n"
-                     f"## 2. Architecture Overview\n\n```mermaid\n{_g('p1_overview_architecture_mermaid')}\n```\n\n"
-                     f"## 3. Interaction Flow (Happy path)\n\n```mermaid\n{_g('p1_overview_flow_mermaid')}\n```",
+                     f"## 2. Architecture Overview\n\n{_d('p1_overview_architecture_mermaid')}\n\n"
+                     f"## 3. Interaction Flow (Happy path)\n\n{_d('p1_overview_flow_mermaid')}",
                      
          "p2-architecture.md": f"# P2. Architecture\n\n"
-                               f"## 1. Architecture Diagram (deep)\n\n```mermaid\n{_g('p2_deep_architecture_mermaid')}\n```\n\n"
-                               f"## 2. Interaction Flow (deep)\n\n```mermaid\n{_g('p2_deep_flow_mermaid')}\n```\n\n"
+                               f"## 1. Architecture Diagram (deep)\n\n{_d('p2_deep_architecture_mermaid')}\n\n"
+                               f"## 2. Interaction Flow (deep)\n\n{_d('p2_deep_flow_mermaid')}\n\n"
                                f"## 3. Data Architecture\n\n{_g('p2_data_architecture')}\n\n"
                                f"## 4. Interface Specification\n\n{_g('p2_interface_spec')}",
                                
@@ -243,22 +574,25 @@ def mkdocs_compiler(state: AgentState):
                            f"## 2. When NOT to Use\n\n{_g('p7_when_not_to_use')}"
     }
     
-    for filename, content in files_map.items():
-         with open(os.path.join(docs_dir, filename), "w", encoding="utf-8") as f:
-             f.write(content)
-             
-    # Write mkdocs.yml (keeping original structure)
+    files = {os.path.join("docs", filename): content for filename, content in {**files_map, **assets}.items()}
+
+    # mermaid.js is only loaded when some page still renders a diagram client-side
+    mermaid_fences = ""
+    if any("```mermaid" in content for content in files_map.values()):
+        mermaid_fences = """
+      custom_fences:
+        - name: mermaid
+          class: mermaid
+          format: !!python/name:pymdownx.superfences.fence_code_format"""
+
+    # mkdocs.yml (keeping original structure)
     mkdocs_yml_content = f"""site_name: {state['framework_name']} Standard
 theme:
   name: material
   features:
     - navigation.tabs
 markdown_extensions:
-  - pymdownx.superfences:
-      custom_fences:
-        - name: mermaid
-          class: mermaid
-          format: !!python/name:pymdownx.superfences.fence_code_format
+  - pymdownx.superfences:{mermaid_fences}
 
 nav:
   - P1. Overview: index.md
@@ -269,7 +603,33 @@ nav:
   - P6. Risks & Anti-patterns: p6-risks.md
   - P7. Decision Guide: p7-decision.md
 """
-    with open(os.path.join(output_dir, "mkdocs.yml"), "w", encoding="utf-8") as f:
-         f.write(mkdocs_yml_content)
+    files["mkdocs.yml"] = mkdocs_yml_content
+    return files
+
+def mkdocs_compiler(state: AgentState):
+    print(f"--- NODE: mkdocs_compiler ---")
+
+    output_dir = state.get("output_dir") or "output"
+    files = render_site(state)
+
+    # Only pages whose content changed are rewritten, each one atomically
+    changed = write_site(output_dir, files)
+    # Diagrams that changed leave their old SVGs behind
+    stale = prune_dir(output_dir, os.path.join("docs", DIAGRAM_ASSETS_DIR), files)
+    if stale:
+        print(f"Removed {len(stale)} unused diagram file(s).")
+    print(f"Updated {len(changed)} of {len(files)} files: {', '.join(changed) or 'none'}")
+
+    if os.environ.get("MKDOCS_BUILD", "0") == "1" and (changed or not os.path.isdir(os.path.join(output_dir, "site"))):
+        build_site(output_dir, changed)
+    discard_partial(output_dir)
+
+    status = f"Success! Documentation generated in {output_dir}"
+    # Persist the final state so single sections can be regenerated without a full run
+    save_state({**state, "mkdocs_status": status}, os.path.join(output_dir, STATE_FILENAME))
          
-    return {"mkdocs_status": "Success! Documentation generated in ./output"}
+    return {"mkdocs_status": status}
+
+async def amkdocs_compiler(state: AgentState):
+    # Pure file I/O: keep it off the event loop
+    return await asyncio.to_thread(mkdocs_compiler, state)
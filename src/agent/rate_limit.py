@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+WINDOW_SECONDS = 60.0
+
+
+class QuotaRateLimiter(BaseRateLimiter):
+    """
+    Process-wide requests-per-minute / tokens-per-minute limiter.
+
+    LangChain calls acquire() right before each API request (cache hits are not
+    counted). Token usage is only known after a response arrives, so it is fed
+    back through TokenUsageRecorder and a new request waits while the tokens
+    spent in the last minute plus the average cost of one request would exceed
+    the TPM quota. A limit of 0 disables that dimension.
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = deque()  # request timestamps
+        self._tokens = deque()    # (timestamp, tokens)
+        self._total_tokens = 0
+        self._total_responses = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._requests and now - self._requests[0] >= WINDOW_SECONDS:
+            self._requests.popleft()
+        while self._tokens and now - self._tokens[0][0] >= WINDOW_SECONDS:
+            self._tokens.popleft()
+
+    def _wait_time(self, now: float) -> float:
+        """Seconds until a request may be sent, 0 if it may be sent now."""
+        self._prune(now)
+        waits = [0.0]
+        if self.rpm and len(self._requests) >= self.rpm:
+            waits.append(WINDOW_SECONDS - (now - self._requests[0]))
+        if self.tpm and self._tokens:
+            expected = self._total_tokens / self._total_responses if self._total_responses else 0
+            used = sum(tokens for _, tokens in self._tokens)
+            if used + expected > self.tpm:
+                waits.append(WINDOW_SECONDS - (now - self._tokens[0][0]))
+        return max(waits)
+
+    def _try_acquire(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._wait_time(now)
+            if wait <= 0:
+                self._requests.append(now)
+            return wait
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                return True
+            if not blocking:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(min(wait, 1.0))
+
+    def record_tokens(self, tokens: int):
+        with self._lock:
+            self._tokens.append((time.monotonic(), tokens))
+            self._total_tokens += tokens
+            self._total_responses += 1
+
+
+class TokenUsageRecorder(BaseCallbackHandler):
+    """Feeds the token usage of every model response back into the limiter."""
+
+    def __init__(self, limiter: QuotaRateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        tokens = 0
+        for generations in response.generations:
+            for gen in generations:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                tokens += usage.get("total_tokens", 0)
+        if tokens:
+            self.limiter.record_tokens(tokens)
+
+
+_limiter: Optional[QuotaRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def configure_rate_limiter(rpm: int = 0, tpm: int = 0) -> Optional[QuotaRateLimiter]:
+    """Installs the process-wide limiter used by get_llm(). Both limits 0 removes it."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = QuotaRateLimiter(rpm=rpm, tpm=tpm) if (rpm or tpm) else None
+        return _limiter
+
+
+def get_rate_limiter() -> Optional[QuotaRateLimiter]:
+    """Returns the process-wide limiter, created from LLM_RPM / LLM_TPM on first use."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            rpm = int(os.environ.get("LLM_RPM", "0"))
+            tpm = int(os.environ.get("LLM_TPM", "0"))
+            if rpm or tpm:
+                _limiter = QuotaRateLimiter(rpm=rpm, tpm=tpm)
+        return _limiter
@@ -0,0 +1,87 @@
+from typing import Dict, List
+
+from src.agent.nodes import (
+    lead_architect,
+    visual_architect,
+    diagram_validator,
+    backend_engineer,
+    infra_security_devops,
+    governance_lead,
+    mkdocs_compiler,
+    pending_diagram_keys
+)
+from src.agent.state import AgentState
+
+# Node execution order of the full graph, minus the plumbing nodes
+NODE_ORDER = [
+    "lead_architect",
+    "visual_architect",
+    "backend_engineer",
+    "infra_security_devops",
+    "governance_lead",
+]
+
+# Which nodes write the fields rendered on each page
+SECTION_NODES: Dict[str, List[str]] = {
+    "P1": ["lead_architect", "visual_architect"],
+    "P2": ["visual_architect", "backend_engineer"],
+    "P3": ["backend_engineer", "infra_security_devops"],
+    "P4": ["infra_security_devops"],
+    "P5": ["infra_security_devops"],
+    "P6": ["governance_lead"],
+    "P7": ["governance_lead"],
+}
+
+CONTENT_NODES = {
+    "lead_architect": lead_architect,
+    "backend_engineer": backend_engineer,
+    "infra_security_devops": infra_security_devops,
+    "governance_lead": governance_lead,
+}
+
+
+def resolve_targets(targets: List[str]) -> List[str]:
+    """Maps node names and P1-P7 section ids to the nodes to re-run, in graph order."""
+    nodes = set()
+    for target in targets:
+        key = target.strip()
+        if key.upper() in SECTION_NODES:
+            nodes.update(SECTION_NODES[key.upper()])
+        elif key in NODE_ORDER:
+            nodes.add(key)
+        else:
+            valid = ", ".join(list(SECTION_NODES) + NODE_ORDER)
+            raise ValueError(f"Unknown section or node '{target}'. Expected one of: {valid}")
+    return [n for n in NODE_ORDER if n in nodes]
+
+
+def _redraw_diagrams(state: AgentState) -> AgentState:
+    """Runs the visual_architect / diagram_validator loop from scratch on the saved state."""
+    state = {
+        **state,
+        "valid_diagrams": [],
+        "diagrams_pending": [],
+        "diagram_key_attempts": {},
+        "diagram_key_errors": {},
+        "diagram_errors": [],
+        "diagram_attempts": 0,
+    }
+    while pending_diagram_keys(state):
+        state = {**state, **visual_architect(state)}
+        state = {**state, **diagram_validator(state)}
+    return state
+
+
+def regenerate(state: AgentState, targets: List[str]) -> AgentState:
+    """
+    Re-executes only the nodes behind the given sections/nodes on a saved run
+    state, keeps every other field, and recompiles the site.
+    """
+    nodes = resolve_targets(targets)
+    print(f"Regenerating: {', '.join(nodes)}")
+    for node in nodes:
+        if node == "visual_architect":
+            state = _redraw_diagrams(state)
+        else:
+            state = {**state, **CONTENT_NODES[node](state)}
+    return {**state, **mkdocs_compiler(state)}
@@ -1,10 +1,13 @@
 from typing import Dict, List, TypedDict, Annotated
+import json
 import operator
+import os
 
 class AgentState(TypedDict):
     # Base Inputs
     framework_name: str
     framework_description: str
+    output_dir: str
     
     # Core Concept (P1 context to guide all agents)
     core_concept_directive: str
@@ -43,4 +46,42 @@ class AgentState(TypedDict):
     # Validation & Status
     diagram_errors: List[str]
     diagram_attempts: int
+    # Per-diagram validation state, keyed by the *_mermaid field name
+    valid_diagrams: List[str]
+    diagrams_pending: List[str]
+    diagram_key_attempts: Dict[str, int]
+    diagram_key_errors: Dict[str, str]
     mkdocs_status: str
+
+
+def initial_state(framework_name: str, framework_description: str = "", output_dir: str = "output") -> AgentState:
+    """Builds the input state for one documentation run."""
+    return {
+        "framework_name": framework_name,
+        "framework_description": framework_description,
+        "output_dir": output_dir,
+        "diagram_errors": [],
+        "diagram_attempts": 0,
+        "valid_diagrams": [],
+        "diagram_key_attempts": {},
+        "diagram_key_errors": {}
+    }
+
+
+# Final state of a run, saved next to its site so sections can be regenerated later
+STATE_FILENAME = "run_state.json"
+
+
+def save_state(state: AgentState, path: str):
+    """Atomically writes a run's state as JSON."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(state), f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_state(path: str) -> AgentState:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List
+from dotenv import load_dotenv
+
+# Ensure environment variables are loaded
+load_dotenv()
+
+from src.agent.graph import build_graph
+from src.agent.hedging import configure_call_threads
+from src.agent.nodes import discard_partial
+from src.agent.rate_limit import configure_rate_limiter
+from src.agent.state import initial_state
+from src.utils.metrics import RunMetrics, bind_run
+
+REPORT_FILENAME = "batch_report.json"
+
+
+def _slugify(text: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+    return slug or "topic"
+
+
+def load_manifest(path: str) -> List[Dict[str, str]]:
+    """
+    Reads a JSONL manifest, one topic per line.
+    Accepts topic/description records as well as title/body records such as
+    requests.jsonl; the id falls back to a slug of the topic.
+    """
+    records = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_no}: invalid JSON ({e})")
+            topic = raw.get("topic") or raw.get("title")
+            if not topic:
+                raise ValueError(f"{path}:{line_no}: record has no 'topic' or 'title'")
+            record_id = _slugify(str(raw.get("id") or raw.get("request_id") or topic))
+            if record_id in seen:
+                raise ValueError(f"{path}:{line_no}: duplicate topic id '{record_id}'")
+            seen.add(record_id)
+            records.append({
+                "id": record_id,
+                "topic": topic,
+                "description": raw.get("description") or raw.get("body") or "",
+            })
+    return records
+
+
+class BatchReport:
+    """Per-topic status, persisted after every update so a restart can resume."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f).get("topics", {})
+
+    def is_done(self, record_id: str) -> bool:
+        return self.entries.get(record_id, {}).get("status") == "success"
+
+    def update(self, record_id: str, **fields):
+        with self._lock:
+            self.entries.setdefault(record_id, {}).update(fields)
+            self._save()
+
+    def _save(self):
+        summary = {"success": 0, "failed": 0, "running": 0}
+        for entry in self.entries.values():
+            status = entry.get("status", "running")
+            summary[status] = summary.get(status, 0) + 1
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "topics": self.entries}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def _record_result(report: BatchReport, record_id: str, started: float, final=None, error: Exception = None) -> bool:
+    fields = {
+        "latency_seconds": round(time.monotonic() - started, 3),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if error is not None:
+        report.update(record_id, status="failed", error=str(error), **fields)
+        return False
+    report.update(record_id, status="success", diagram_attempts=final.get("diagram_attempts", 0), **fields)
+    return True
+
+
+def run_topic(app, record: Dict[str, str], output_root: str, report: BatchReport) -> bool:
+    output_dir = os.path.join(output_root, record["id"])
+    started = time.monotonic()
+    report.update(record["id"], topic=record["topic"], output_dir=output_dir, status="running", error=None)
+    run_metrics = RunMetrics(record["id"], record["topic"])
+    try:
+        with bind_run(run_metrics):
+            final = app.invoke(initial_state(record["topic"], record["description"], output_dir))
+    except Exception as e:
+        return _record_result(report, record["id"], started, error=e)
+    finally:
+        discard_partial(output_dir)
+        run_metrics.write_report(output_dir)
+    return _record_result(report, record["id"], started, final=final)
+
+
+async def arun_topic(app, record: Dict[str, str], output_root: str, report: BatchReport) -> bool:
+    output_dir = os.path.join(output_root, record["id"])
+    started = time.monotonic()
+    report.update(record["id"], topic=record["topic"], output_dir=output_dir, status="running", error=None)
+    run_metrics = RunMetrics(record["id"], record["topic"])
+    try:
+        with bind_run(run_metrics):
+            final = await app.ainvoke(initial_state(record["topic"], record["description"], output_dir))
+    except Exception as e:
+        return _record_result(report, record["id"], started, error=e)
+    finally:
+        discard_partial(output_dir)
+        run_metrics.write_report(output_dir)
+    return _record_result(report, record["id"], started, final=final)
+
+
+def _print_result(report: BatchReport, record: Dict[str, str], ok: bool):
+    entry = report.entries[record["id"]]
+    print(f"[{'OK' if ok else 'FAILED'}] {record['topic']} ({entry['latency_seconds']}s)")
+
+
+def run_batch(app, todo: List[Dict[str, str]], output_root: str, report: BatchReport, concurrency: int) -> int:
+    """Runs every topic on a bounded thread pool. Returns the number of failures."""
+    failures = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run_topic, app, r, output_root, report): r for r in todo}
+        for future in as_completed(futures):
+            ok = future.result()
+            failures += 0 if ok else 1
+            _print_result(report, futures[future], ok)
+    return failures
+
+
+async def arun_batch(app, todo: List[Dict[str, str]], output_root: str, report: BatchReport, concurrency: int) -> int:
+    """Runs every topic on one event loop, at most `concurrency` at a time. Returns the number of failures."""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def _run(record):
+        async with limit:
+            ok = await arun_topic(app, record, output_root, report)
+        _print_result(report, record, ok)
+        return ok
+
+    results = await asyncio.gather(*(_run(r) for r in todo))
+    return sum(1 for ok in results if not ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate MkDocs Standard Framework Documentation for every topic in a JSONL manifest")
+    parser.add_argument("--manifest", type=str, required=True, help="JSONL file with one {\"topic\", \"description\"} record per line.")
+    parser.add_argument("--output-root", type=str, required=False, default=os.path.join("output", "batch"), help="Each topic is written to <output-root>/<id>.")
+    parser.add_argument("--concurrency", type=int, required=False, default=4, help="Maximum number of topics generated at the same time.")
+    parser.add_argument("--rpm", type=int, required=False, default=int(os.environ.get("LLM_RPM", "0")), help="LLM requests per minute across all topics (0 = unlimited).")
+    parser.add_argument("--tpm", type=int, required=False, default=int(os.environ.get("LLM_TPM", "0")), help="LLM tokens per minute across all topics (0 = unlimited).")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Drive all topics from one asyncio event loop instead of a thread pool.")
+    parser.add_argument("--force", action="store_true", help="Regenerate topics the report already marks as successful.")
+    args = parser.parse_args()
+
+    records = load_manifest(args.manifest)
+    os.makedirs(args.output_root, exist_ok=True)
+    report = BatchReport(os.path.join(args.output_root, REPORT_FILENAME))
+
+    todo = [r for r in records if args.force or not report.is_done(r["id"])]
+    skipped = len(records) - len(todo)
+    print(f"Batch: {len(records)} topics, {skipped} already done, {len(todo)} to generate (concurrency {args.concurrency}).")
+    if not todo:
+        return
+
+    configure_rate_limiter(rpm=args.rpm, tpm=args.tpm)
+
+    # The compiled graph is stateless between invocations, so one instance serves every topic
+    app = build_graph()
+
+    concurrency = max(1, args.concurrency)
+    configure_call_threads(concurrency)
+    if args.use_async:
+        failures = asyncio.run(arun_batch(app, todo, args.output_root, report, concurrency))
+    else:
+        failures = run_batch(app, todo, args.output_root, report, concurrency)
+
+    print(f"\nBatch finished: {len(todo) - failures} succeeded, {failures} failed. Report: {report.path}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
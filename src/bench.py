@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List
+
+# Everything runs offline and uncached so each run pays the full local cost.
+# Set before the agent modules are imported, like main loads .env first.
+os.environ.update({
+    "LLM_BACKEND": "fake",
+    "MERMAID_RENDERER": "fake",
+    "LLM_CACHE_MODE": "passthrough",
+    "MERMAID_CACHE": "0",
+    "MKDOCS_BUILD": "0",
+    "LLM_RPM": "0",
+    "LLM_TPM": "0",
+})
+
+from src.agent.graph import build_graph
+from src.agent.hedging import configure_call_threads
+from src.agent.state import initial_state
+from src.utils.metrics import RunMetrics, bind_run
+
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+
+# name -> environment for the fake model, and whether a run generates a batch of topics
+SCENARIOS: Dict[str, Dict] = {
+    "clean": {"env": {}},
+    "retry_cap": {"env": {"FAKE_LLM_MERMAID": "invalid"}},
+    "malformed_json": {"env": {"FAKE_LLM_JSON": "malformed"}},
+    "truncated_json": {"env": {"FAKE_LLM_JSON": "truncated"}},
+    "batch": {"env": {}, "batch": True},
+}
+SCENARIO_ENV_KEYS = ("FAKE_LLM_MERMAID", "FAKE_LLM_JSON")
+
+# Metrics compared against the baseline; higher is worse for all of them
+COMPARED = ("p50_ms", "p95_ms", "peak_mb")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _run_topic(app, topic: str, output_dir: str, use_async: bool) -> Dict:
+    """Runs one topic end to end. Returns its latency and what it cost in model calls."""
+    run_metrics = RunMetrics(topic, topic)
+    state = initial_state(topic, "Benchmark topic.", output_dir)
+    started = time.perf_counter()
+    with bind_run(run_metrics):
+        if use_async:
+            asyncio.run(app.ainvoke(state))
+        else:
+            app.invoke(state)
+    latency = time.perf_counter() - started
+    nodes = run_metrics.node_summary()
+    return {
+        "latency": latency,
+        "llm_calls": sum(n.get("llm_calls", 0) for n in nodes.values()),
+        "renders": sum(n.get("render_calls", 0) for n in nodes.values()),
+    }
+
+
+def _run_once(app, topics: List[str], work_dir: str, concurrency: int, use_async: bool) -> List[Dict]:
+    def _one(index_topic):
+        index, topic = index_topic
+        return _run_topic(app, topic, os.path.join(work_dir, f"topic-{index}"), use_async)
+
+    if len(topics) == 1:
+        return [_one((0, topics[0]))]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(_one, enumerate(topics)))
+
+
+def run_scenario(name: str, runs: int, batch_size: int, concurrency: int, use_async: bool) -> Dict:
+    scenario = SCENARIOS[name]
+    for key in SCENARIO_ENV_KEYS:
+        os.environ.pop(key, None)
+    os.environ.update(scenario["env"])
+
+    topics = [f"Benchmark Topic {i}" for i in range(batch_size if scenario.get("batch") else 1)]
+    app = build_graph()
+    results, wall = [], 0.0
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as work_dir, contextlib.redirect_stdout(io.StringIO()):
+        # Warm-up run: imports, pydantic schema builds, first-use caches
+        _run_once(app, topics, work_dir, concurrency, use_async)
+        for _ in range(runs):
+            started = time.perf_counter()
+            results.extend(_run_once(app, topics, work_dir, concurrency, use_async))
+            wall += time.perf_counter() - started
+
+        # Separate pass for memory: tracemalloc slows allocation-heavy code down
+        tracemalloc.start()
+        try:
+            _run_once(app, topics, work_dir, concurrency, use_async)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    latencies = [r["latency"] * 1000 for r in results]
+    return {
+        "topics": len(results),
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "throughput_per_s": round(len(results) / wall, 2) if wall else 0.0,
+        "peak_mb": round(peak / (1024 * 1024), 2),
+        "llm_calls_per_topic": round(sum(r["llm_calls"] for r in results) / len(results), 2),
+        "renders_per_topic": round(sum(r["renders"] for r in results) / len(results), 2),
+    }
+
+
+def time_build_graph(repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build_graph()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(_percentile(timings, 50), 2)
+
+
+def print_results(results: Dict):
+    print(f"build_graph: {results['build_graph_ms']} ms")
+    print(f"{'SCENARIO':<16} {'TOPICS':>6} {'P50 ms':>9} {'P95 ms':>9} {'TOPICS/s':>9} {'PEAK MB':>8} {'LLM/TOPIC':>10} {'RENDERS':>8}")
+    for name, row in results["scenarios"].items():
+        print(
+            f"{name:<16} {row['topics']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['throughput_per_s']:>9.2f}"
+            f" {row['peak_mb']:>8.2f} {row['llm_calls_per_topic']:>10.2f} {row['renders_per_topic']:>8.2f}"
+        )
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Lists every compared metric that got worse than the baseline by more than tolerance."""
+    if baseline.get("settings") != results["settings"]:
+        print("Warning: baseline was recorded with different settings; comparison is indicative only.")
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('created_at', '?')} (tolerance {tolerance:.0%}):")
+    for name, row in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        deltas = []
+        for metric in COMPARED:
+            if not base.get(metric):
+                continue
+            change = (row[metric] - base[metric]) / base[metric]
+            deltas.append(f"{metric} {change:+.0%}")
+            if change > tolerance:
+                regressions.append(f"{name}.{metric}: {base[metric]} -> {row[metric]}")
+        print(f"  {name:<16} {', '.join(deltas)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the full workflow with a fake LLM and a fake Mermaid renderer")
+    parser.add_argument("--scenarios", type=str, nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), help="Scenarios to run (default: all).")
+    parser.add_argument("--runs", type=int, default=5, help="Measured runs per scenario, after one warm-up run.")
+    parser.add_argument("--batch-size", type=int, default=8, help="Topics per run in the batch scenario.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Topics generated at the same time in the batch scenario.")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Simulated latency of every model call.")
+    parser.add_argument("--render-latency-ms", type=float, default=0, help="Simulated latency of every diagram render.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Drive the graph with ainvoke instead of invoke.")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help=f"Baseline file (default: {DEFAULT_BASELINE}).")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a metric counts as a regression (default: 0.2 = 20%%).")
+    parser.add_argument("--output", type=str, required=False, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_RENDER_LATENCY_MS"] = str(args.render_latency_ms)
+
+    settings = {
+        "runs": args.runs,
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+        "llm_latency_ms": args.llm_latency_ms,
+        "render_latency_ms": args.render_latency_ms,
+        "async": args.use_async,
+    }
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "settings": settings,
+        "build_graph_ms": time_build_graph(),
+        "scenarios": {},
+    }
+    configure_call_threads(max(1, args.concurrency))
+    for name in args.scenarios:
+        print(f"Running scenario '{name}'...")
+        results["scenarios"][name] = run_scenario(name, args.runs, args.batch_size, max(1, args.concurrency), args.use_async)
+
+    print()
+    print_results(results)
+
+    for path in filter(None, [args.output, args.baseline if args.save_baseline else None]):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,159 @@
 import argparse
+import asyncio
+import os
 import sys
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Ensure environment variables are loaded
 load_dotenv()
 
+from src.agent.checkpoints import (
+    RunRegistry,
+    new_run_id,
+    open_async_checkpointer,
+    open_checkpointer,
+    run_config
+)
 from src.agent.graph import build_graph
+from src.agent.nodes import discard_partial
+from src.agent.regenerate import SECTION_NODES, regenerate, resolve_targets
+from src.agent.state import STATE_FILENAME, initial_state, load_state
+from src.utils.metrics import PROMETHEUS_FILE, RunMetrics, bind_run, write_prometheus_textfile
+
+def run_workflow(initial, config, on_node):
+    app = build_graph(checkpointer=open_checkpointer())
+    if initial is None and not app.get_state(config).next:
+        print("Run already completed; nothing to resume.")
+        return
+    # Stream the output so we can see progress
+    for output in app.stream(initial, config):
+        for key, value in output.items():
+            if key.startswith("__"):
+                continue
+            print(f"Finished Node: {key}")
+            on_node(key)
+
+async def arun_workflow(initial, config, on_node):
+    # Same progress stream, driven by the async node implementations
+    async with open_async_checkpointer() as checkpointer:
+        app = build_graph(checkpointer=checkpointer)
+        if initial is None and not (await app.aget_state(config)).next:
+            print("Run already completed; nothing to resume.")
+            return
+        async for output in app.astream(initial, config):
+            for key, value in output.items():
+                if key.startswith("__"):
+                    continue
+                print(f"Finished Node: {key}")
+                on_node(key)
+
+def print_runs(registry: RunRegistry):
+    runs = registry.list()
+    if not runs:
+        print("No checkpointed runs.")
+        return
+    print(f"{'RUN ID':<24} {'STATUS':<10} {'LAST NODE':<22} {'UPDATED':<19} TOPIC")
+    for run in runs:
+        updated = datetime.fromtimestamp(run["updated_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{run['run_id']:<24} {run['status']:<10} {run['last_node'] or '-':<22} {updated:<19} {run['topic']}")
 
 def main():
     parser = argparse.ArgumentParser(description="Generate MkDocs Standard Framework Documentation")
-    parser.add_argument("--topic", type=str, required=True, help="The standard framework topic to generate documentation for. e.g. 'High TPS API Service'")
+    parser.add_argument("--topic", type=str, required=False, help="The standard framework topic to generate documentation for. e.g. 'High TPS API Service'")
     parser.add_argument("--description", type=str, required=False, default="", help="Optional detailed description or requirements for the framework.")
+    parser.add_argument("--output-dir", type=str, required=False, help="Directory the MkDocs site is written to (default: output).")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the workflow on an asyncio event loop (ainvoke nodes, async Mermaid validation).")
+    parser.add_argument("--run-id", type=str, required=False, help="Id for a new run (default: generated). Used to resume it later.")
+    parser.add_argument("--resume", type=str, required=False, metavar="RUN_ID", help="Continue a checkpointed run from its last completed node.")
+    parser.add_argument("--list-runs", action="store_true", help="List checkpointed runs and exit.")
+    parser.add_argument("--prune-runs", type=float, required=False, metavar="DAYS", help="Delete checkpoints of runs not updated for DAYS days and exit.")
+    parser.add_argument("--regenerate", type=str, nargs="+", metavar="TARGET", help=f"Re-run only these nodes or sections ({', '.join(SECTION_NODES)}) on a saved run state, then recompile the site.")
+    parser.add_argument("--state", type=str, required=False, help=f"Saved run state for --regenerate (default: <output-dir>/{STATE_FILENAME}).")
     args = parser.parse_args()
 
-    topic = args.topic
-    description = args.description
-    print(f"Starting documentation generation for: '{topic}'")
-    if description:
-        print(f"Using description: '{description}'")
-    
-    # Build LangGraph app
-    app = build_graph()
-    
-    # Initialize state
-    initial_state = {
-        "framework_name": topic,
-        "framework_description": description,
-        "diagram_errors": [],
-        "diagram_attempts": 0
-    }
-    
+    if args.regenerate:
+        state_path = args.state or os.path.join(args.output_dir or "output", STATE_FILENAME)
+        if not os.path.exists(state_path):
+            parser.error(f"no saved run state at '{state_path}'")
+        try:
+            resolve_targets(args.regenerate)
+        except ValueError as e:
+            parser.error(str(e))
+        state = load_state(state_path)
+        if args.output_dir:
+            state["output_dir"] = args.output_dir
+        print(f"Regenerating sections of: '{state['framework_name']}' from {state_path}")
+        try:
+            regenerate(state, args.regenerate)
+            print("\nRegeneration completed successfully!")
+        except Exception as e:
+            discard_partial(state.get("output_dir"))
+            print(f"\nRegeneration failed with error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    registry = RunRegistry()
+    if args.list_runs:
+        print_runs(registry)
+        return
+    if args.prune_runs is not None:
+        pruned = registry.prune(args.prune_runs, open_checkpointer())
+        print(f"Pruned {len(pruned)} run(s).")
+        return
+
+    if args.resume:
+        run = registry.get(args.resume)
+        if run is None:
+            parser.error(f"unknown run id '{args.resume}' (see --list-runs)")
+        run_id = args.resume
+        initial = None
+        topic = run["topic"]
+        output_dir = run["output_dir"] or "output"
+        print(f"Resuming run {run_id} for: '{topic}' (last completed node: {run['last_node'] or '-'})")
+        registry.update(run_id, status="running")
+    else:
+        if not args.topic:
+            parser.error("--topic is required unless --resume, --list-runs or --prune-runs is given")
+        topic = args.topic
+        description = args.description
+        print(f"Starting documentation generation for: '{topic}'")
+        if description:
+            print(f"Using description: '{description}'")
+        run_id = args.run_id or new_run_id()
+        # Initialize state
+        output_dir = args.output_dir or "output"
+        initial = initial_state(topic, description, output_dir)
+        registry.start(run_id, topic, output_dir)
+    print(f"Run id: {run_id}")
+
+    config = run_config(run_id)
+    on_node = lambda key: registry.update(run_id, last_node=key)
+
+    run_metrics = RunMetrics(run_id, topic)
+
     # Run the graph
     print("Executing workflow...")
     try:
-        # Stream the output so we can see progress
-        for output in app.stream(initial_state):
-            for key, value in output.items():
-                print(f"Finished Node: {key}")
-                
+        with bind_run(run_metrics):
+            if args.use_async:
+                asyncio.run(arun_workflow(initial, config, on_node))
+            else:
+                run_workflow(initial, config, on_node)
+
+        registry.update(run_id, status="completed")
         print("\nWorkflow completed successfully!")
     except Exception as e:
+        registry.update(run_id, status="failed")
         print(f"\nWorkflow failed with error: {e}", file=sys.stderr)
+        print(f"Completed nodes are checkpointed. Continue with: --resume {run_id}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        discard_partial(output_dir)
+        report_path = run_metrics.write_report(output_dir)
+        if PROMETHEUS_FILE:
+            write_prometheus_textfile(run_metrics, PROMETHEUS_FILE)
+        print(f"\n{run_metrics.summary_table()}\nRun report: {report_path}")
 
 if __name__ == "__main__":
     main()
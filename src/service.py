@@ -0,0 +1,302 @@
+import argparse
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+# Ensure environment variables are loaded
+load_dotenv()
+
+from src.agent.graph import build_graph
+from src.agent.hedging import configure_call_threads
+from src.agent.nodes import discard_partial
+from src.agent.state import initial_state
+from src.utils.mermaid import renderer_version
+from src.utils.metrics import RunMetrics, bind_run
+
+JOB_ROUTE = re.compile(r"^/jobs/(?P<job_id>[A-Za-z0-9\-]+)(?P<events>/events)?/?$")
+FINISHED = ("succeeded", "failed")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Job:
+    """One generation request and the node events it has produced so far."""
+
+    def __init__(self, topic: str, description: str, output_root: str):
+        self.id = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.topic = topic
+        self.description = description
+        self.output_dir = os.path.join(output_root, self.id)
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.requests = 1  # submissions collapsed into this job
+        self.created_at = _now()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.events: List[Dict] = []
+        self._changed = threading.Condition()
+
+    def add_event(self, event: str, **data):
+        with self._changed:
+            self.events.append({"event": event, "at": _now(), **data})
+            self._changed.notify_all()
+
+    def set_status(self, status: str, error: Optional[str] = None):
+        with self._changed:
+            self.status = status
+            self.error = error
+            if status == "running":
+                self.started_at = _now()
+            elif status in FINISHED:
+                self.finished_at = _now()
+            self.events.append({"event": "status", "at": _now(), "status": status, "error": error})
+            self._changed.notify_all()
+
+    def wait_for_events(self, seen: int, timeout: float) -> List[Dict]:
+        """Blocks until there are events past `seen` (or timeout) and returns them."""
+        with self._changed:
+            if len(self.events) <= seen and self.status not in FINISHED:
+                self._changed.wait(timeout)
+            return self.events[seen:]
+
+    def to_dict(self) -> Dict:
+        with self._changed:
+            return {
+                "job_id": self.id,
+                "topic": self.topic,
+                "description": self.description,
+                "status": self.status,
+                "error": self.error,
+                "output_dir": self.output_dir,
+                "requests": self.requests,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "completed_nodes": [e["node"] for e in self.events if e["event"] == "node"],
+                "ready_fields": [e["field"] for e in self.events if e["event"] == "field"],
+            }
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobManager:
+    """
+    Runs jobs on a fixed pool of worker threads against one compiled graph.
+    Identical topic/description submissions that arrive while a job for them
+    is queued or running join that job instead of starting another one.
+    """
+
+    def __init__(self, output_root: str, workers: int, queue_size: int, max_jobs: int = 1000):
+        self.output_root = output_root
+        self.max_jobs = max_jobs
+        # The compiled graph keeps no per-run state, so every worker shares it
+        self.app = build_graph()
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._inflight: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=queue_size)
+        self._workers = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True) for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @staticmethod
+    def _flight_key(topic: str, description: str) -> str:
+        return hashlib.sha256(f"{topic.strip()}\0{description.strip()}".encode("utf-8")).hexdigest()
+
+    def submit(self, topic: str, description: str = ""):
+        """Returns (job, deduplicated). Raises QueueFull when no slot is free."""
+        key = self._flight_key(topic, description)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None and job.status not in FINISHED:
+                job.requests += 1
+                return job, True
+            job = Job(topic, description, self.output_root)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull()
+            self._inflight[key] = job
+            self.jobs[job.id] = job
+            self._evict()
+            return job, False
+
+    def _evict(self):
+        """Forgets the oldest finished jobs beyond max_jobs (their output stays on disk)."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            "workers": len(self._workers),
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "succeeded": statuses.count("succeeded"),
+            "failed": statuses.count("failed"),
+        }
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            finally:
+                key = self._flight_key(job.topic, job.description)
+                with self._lock:
+                    # A newer job for the same request may already have taken the slot
+                    if self._inflight.get(key) is job:
+                        del self._inflight[key]
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        job.set_status("running")
+        run_metrics = RunMetrics(job.id, job.topic)
+        try:
+            with bind_run(run_metrics):
+                # "custom" carries each section as soon as it has streamed in, before its node finishes
+                for mode, output in self.app.stream(
+                    initial_state(job.topic, job.description, job.output_dir), stream_mode=["updates", "custom"]
+                ):
+                    if mode == "custom":
+                        job.add_event("field", **output)
+                        continue
+                    for node in output:
+                        if not node.startswith("__"):
+                            job.add_event("node", node=node)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.set_status("failed", error=str(e))
+        else:
+            job.set_status("succeeded")
+        finally:
+            discard_partial(job.output_dir)
+            run_metrics.write_report(job.output_dir)
+
+    def shutdown(self):
+        for _ in self._workers:
+            self._queue.put(None)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    manager: JobManager = None
+    server_version = "ZutaService/1.0"
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/healthz":
+            return self._send_json(200, {"status": "ok", **self.manager.stats()})
+        match = JOB_ROUTE.match(self.path)
+        job = self.manager.get(match.group("job_id")) if match else None
+        if job is None:
+            return self._send_json(404, {"error": "not found"})
+        if match.group("events"):
+            return self._stream_events(job)
+        return self._send_json(200, job.to_dict())
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            return self._send_json(400, {"error": "body must be a JSON object"})
+        topic = payload.get("topic") if isinstance(payload, dict) else None
+        if not isinstance(topic, str) or not topic.strip():
+            return self._send_json(400, {"error": "'topic' is required"})
+        description = payload.get("description") or ""
+        try:
+            job, deduplicated = self.manager.submit(topic.strip(), str(description))
+        except QueueFull:
+            return self._send_json(503, {"error": "job queue is full, retry later"}, {"Retry-After": "30"})
+        return self._send_json(200 if deduplicated else 202, {**job.to_dict(), "deduplicated": deduplicated})
+
+    def _stream_events(self, job: Job):
+        """Server-sent events: replays the job's events, then follows it until it finishes."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        seen = 0
+        try:
+            while True:
+                events = job.wait_for_events(seen, timeout=15)
+                if not events:
+                    # Keep-alive comment so proxies do not close an idle stream
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    self.wfile.write(f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                seen += len(events)
+                if job.status in FINISHED and seen >= len(job.events):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def log_message(self, format, *args):
+        print(f"[{self.log_date_time_string()}] {self.address_string()} {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve documentation generation jobs over HTTP")
+    parser.add_argument("--host", type=str, default=os.environ.get("SERVICE_HOST", "127.0.0.1"), help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SERVICE_PORT", "8000")), help="Port to listen on.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SERVICE_WORKERS", "2")), help="Jobs generated at the same time.")
+    parser.add_argument("--queue-size", type=int, default=int(os.environ.get("SERVICE_QUEUE_SIZE", "16")), help="Jobs that may wait for a worker before submissions are rejected.")
+    parser.add_argument("--output-root", type=str, default=os.environ.get("SERVICE_OUTPUT_ROOT", os.path.join("output", "service")), help="Each job is written to <output-root>/<job id>.")
+    args = parser.parse_args()
+
+    print("Compiling workflow and warming up the Mermaid renderer...")
+    started = time.monotonic()
+    configure_call_threads(max(1, args.workers))
+    manager = JobManager(args.output_root, max(1, args.workers), max(1, args.queue_size))
+    renderer = renderer_version()
+    print(f"Ready in {time.monotonic() - started:.1f}s (renderer: {renderer or 'unavailable'}).")
+
+    ServiceHandler.manager = manager
+    server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    server.daemon_threads = True
+    print(f"Listening on http://{args.host}:{args.port} (POST /jobs, GET /jobs/<id>, GET /jobs/<id>/events, GET /healthz)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
+        manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
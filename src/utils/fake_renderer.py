@@ -0,0 +1,36 @@
+import asyncio
+import os
+import time
+from typing import Tuple
+
+# Diagrams containing this token are rejected, like a real renderer would
+# reject the broken diagrams FakeChatModel emits with mermaid_mode="invalid".
+ERROR_TOKEN = "INVALID"
+VERSION = "fake-renderer 1"
+
+
+def _latency() -> float:
+    return float(os.environ.get("FAKE_RENDER_LATENCY_MS", "0")) / 1000
+
+
+def _result(mermaid_code: str) -> Tuple[str, str]:
+    for line_no, line in enumerate(mermaid_code.splitlines(), start=1):
+        if ERROR_TOKEN in line:
+            return f"Parse error on line {line_no}:\n{line}\n^ Unexpected token '{ERROR_TOKEN}'", ""
+    return "", f'<svg xmlns="http://www.w3.org/2000/svg" data-lines="{len(mermaid_code.splitlines())}"></svg>'
+
+
+def fake_render(mermaid_code: str) -> Tuple[str, str]:
+    """
+    Offline stand-in for the Mermaid renderer (MERMAID_RENDERER=fake).
+    Sleeps FAKE_RENDER_LATENCY_MS and returns (error, svg).
+    """
+    if _latency():
+        time.sleep(_latency())
+    return _result(mermaid_code)
+
+
+async def afake_render(mermaid_code: str) -> Tuple[str, str]:
+    if _latency():
+        await asyncio.sleep(_latency())
+    return _result(mermaid_code)
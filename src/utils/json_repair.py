@@ -0,0 +1,226 @@
+import json
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from src.utils import metrics
+
+# How each model response was turned into JSON, for instrumentation:
+#   direct      - the text was valid JSON as-is
+#   unwrapped   - valid after stripping code fences / surrounding prose
+#   lenient     - valid once raw control characters (newlines) were allowed in strings
+#   commas      - trailing commas before '}' / ']' were removed
+#   quotes      - unescaped double quotes inside string values were escaped
+#   truncated   - output was cut off and had to be closed
+#   failed      - nothing recoverable
+# Callers add their own follow-up paths (e.g. reprompt, unrecovered_fields).
+RECOVERY_COUNTS: Counter = Counter()
+_counts_lock = threading.Lock()
+
+FENCE = re.compile(r"^```[a-zA-Z]*\s*\n?|\n?```\s*$")
+
+
+def count_recovery(stage: str, n: int = 1):
+    with _counts_lock:
+        RECOVERY_COUNTS[stage] += n
+    metrics.incr(f"json_recovery.{stage}", n)
+
+
+def recovery_counts() -> Dict[str, int]:
+    with _counts_lock:
+        return dict(RECOVERY_COUNTS)
+
+
+def _unwrap(text: str) -> str:
+    """Drops code fences and any prose before the first '{' / after the last '}'."""
+    text = FENCE.sub("", text.strip()).strip()
+    start = text.find("{")
+    if start == -1:
+        return text
+    end = text.rfind("}")
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def _next_significant(text: str, i: int) -> str:
+    while i < len(text) and text[i] in " \t\r\n":
+        i += 1
+    return text[i] if i < len(text) else ""
+
+
+def _escape_inner_quotes(text: str) -> str:
+    """
+    Escapes double quotes that appear inside string values, e.g. Mermaid labels
+    like A["Client"] that the model forgot to escape. A quote only closes a
+    string when what follows is structural JSON.
+    """
+    out = []
+    containers = []  # '{' or '[' for every open container outside strings
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if not in_string:
+            if ch == '"':
+                in_string = True
+            elif ch in "{[":
+                containers.append(ch)
+            elif ch in "}]" and containers:
+                containers.pop()
+            out.append(ch)
+            continue
+        if escaped:
+            escaped = False
+            out.append(ch)
+            continue
+        if ch == "\\":
+            escaped = True
+            out.append(ch)
+            continue
+        if ch == '"':
+            closer = "]" if containers and containers[-1] == "[" else "}"
+            nxt = _next_significant(text, i + 1)
+            if nxt in (":", closer, ""):
+                in_string = False
+                out.append(ch)
+            elif nxt == ",":
+                # Only a real separator if another value or the end of the container follows
+                j = text.index(",", i + 1)
+                if _next_significant(text, j + 1) in ('"', closer, ""):
+                    in_string = False
+                    out.append(ch)
+                else:
+                    out.append('\\"')
+            else:
+                out.append('\\"')
+            continue
+        out.append(ch)
+    return "".join(out)
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Removes commas directly followed by '}' or ']', leaving string contents alone."""
+    out = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "," and _next_significant(text, i + 1) in ("}", "]"):
+            continue
+        out.append(ch)
+    return "".join(out)
+
+
+def _close_truncated(text: str) -> Tuple[str, Optional[str]]:
+    """
+    Closes a JSON object that was cut off mid-output.
+    Returns the repaired text and the key whose value was cut off, if any.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    last_key = None
+    string_start = 0
+    expecting_key = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                if expecting_key:
+                    last_key = text[string_start + 1:i]
+            continue
+        if ch == '"':
+            in_string = True
+            string_start = i
+            expecting_key = bool(stack) and stack[-1] == "}" and _last_structural(text, i) in ("{", ",")
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    if not stack and not in_string:
+        return text, None
+
+    cut_key = None
+    if in_string:
+        if expecting_key:
+            # Cut inside a key: drop the dangling key entirely
+            text = text[:string_start]
+        else:
+            text += '"'
+            cut_key = last_key
+    text = text.rstrip()
+    # Drop a dangling separator or a key without its value
+    text = re.sub(r',\s*"[^"]*"\s*:\s*$', "", text)
+    if stack[-1] == "}":
+        # A complete key cut off before its colon, e.g. {"a": "x", "b"
+        text = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*$', r"\1", text)
+    text = re.sub(r'[,:]\s*$', "", text)
+    text += "".join(reversed(stack))
+    return text, cut_key
+
+
+def _last_structural(text: str, i: int) -> str:
+    j = i - 1
+    while j >= 0 and text[j] in " \t\r\n":
+        j -= 1
+    return text[j] if j >= 0 else ""
+
+
+def _loads(text: str, strict: bool = True) -> Optional[Any]:
+    try:
+        return json.loads(text, strict=strict)
+    except json.JSONDecodeError:
+        return None
+
+
+def repair_json_object(text: str, record: bool = True) -> Tuple[Optional[Dict[str, Any]], str, Optional[str]]:
+    """
+    Recovers a JSON object from raw model output without calling the model again.
+    Returns (data, stage, truncated_key): stage is one of the RECOVERY_COUNTS
+    keys and truncated_key names a field whose value was cut off, if any.
+    Pass record=False to inspect a response without counting it.
+    """
+    data, stage, cut_key = _repair(text or "")
+    if record:
+        count_recovery(stage)
+    return data, stage, cut_key
+
+
+def _repair(text: str) -> Tuple[Optional[Dict[str, Any]], str, Optional[str]]:
+    data = _loads(text)
+    if isinstance(data, dict):
+        return data, "direct", None
+
+    body = _unwrap(text)
+    attempts = (
+        ("unwrapped", lambda: _loads(body)),
+        ("lenient", lambda: _loads(body, strict=False)),
+        ("commas", lambda: _loads(_strip_trailing_commas(body), strict=False)),
+        ("quotes", lambda: _loads(_strip_trailing_commas(_escape_inner_quotes(body)), strict=False)),
+    )
+    for stage, attempt in attempts:
+        data = attempt()
+        if isinstance(data, dict):
+            return data, stage, None
+
+    # A truncated response has no closing brace, so keep everything after the first '{'
+    start = text.find("{")
+    tail = FENCE.sub("", text[start:]) if start != -1 else body
+    closed, cut_key = _close_truncated(_escape_inner_quotes(tail))
+    data = _loads(_strip_trailing_commas(closed), strict=False)
+    if isinstance(data, dict):
+        return data, "truncated", cut_key
+
+    return None, "failed", None
@@ -0,0 +1,86 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class JsonFieldStream:
+    """
+    Incremental parser for a streamed JSON object.
+    feed() takes the next chunk of model output and returns the top-level
+    fields whose values became complete in it, as (name, value) pairs.
+    Text before the opening brace (prose, a code fence) is skipped.
+    Values that do not parse are skipped; the full response is still parsed
+    (and repaired) normally once the stream ends.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._text += chunk
+        fields = []
+        text = self._text
+        while self._pos < len(text) and not self._done:
+            i, ch = self._pos, text[self._pos]
+            self._pos += 1
+            if not self._started:
+                if ch == "{":
+                    self._started, self._depth, self._expect_key = True, 1, True
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._key = text[self._string_start + 1:i]
+                        self._expect_key = False
+                    elif self._depth == 1 and self._value_start == self._string_start:
+                        self._emit(fields, text[self._value_start:i + 1])
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+                if self._depth == 1 and not self._expect_key and self._value_start is None and self._key is not None:
+                    self._value_start = i
+            elif ch in "{[":
+                if self._depth == 1 and self._value_start is None and self._key is not None:
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._emit(fields, text[self._value_start:i + 1])
+                elif self._depth == 0:
+                    if self._value_start is not None:
+                        self._emit(fields, text[self._value_start:i])
+                    self._done = True
+            elif self._depth == 1:
+                if ch == ",":
+                    if self._value_start is not None:
+                        self._emit(fields, text[self._value_start:i])
+                    self._expect_key = True
+                elif ch not in " \t\r\n:" and self._value_start is None and self._key is not None:
+                    # Number, true/false/null: complete at the next ',' or '}'
+                    self._value_start = i
+        return fields
+
+    def _emit(self, fields: List[Tuple[str, Any]], raw: str):
+        key, self._key, self._value_start = self._key, None, None
+        try:
+            fields.append((key, json.loads(raw.strip(), strict=False)))
+        except json.JSONDecodeError:
+            pass
@@ -1,29 +1,250 @@
+import asyncio
+import re
 import subprocess
 import tempfile
 import os
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import Dict, List, Optional, Tuple
 
-def validate_mermaid_syntax(mermaid_code: str) -> str:
-    """
-    Validates Mermaid syntax by running the @mermaid-js/mermaid-cli (mmdc).
-    Writes to a temp file, runs mmdc, and returns empty string if valid, 
-    or the error message if invalid.
-    """
-    if not mermaid_code or not mermaid_code.strip():
-        return "Mermaid code is empty."
+from src.utils import fake_renderer, metrics
+from src.utils.mermaid_cache import diagram_key, get_svg_store, get_validation_cache
+from src.utils.mermaid_worker import RENDER_TIMEOUT, get_worker
 
-    # Strip markdown code blocks if present
+def _strip_code_fences(mermaid_code: str) -> str:
+    """Strip markdown code blocks if present."""
     if mermaid_code.startswith("```mermaid"):
         mermaid_code = mermaid_code[len("```mermaid"):].strip()
     if mermaid_code.startswith("```"):
         mermaid_code = mermaid_code[3:].strip()
     if mermaid_code.endswith("```"):
         mermaid_code = mermaid_code[:-3].strip()
+    return mermaid_code
+
+# --- In-process pre-validation ---
+# A cheap lexer/checker for the diagram types the agents generate. It only
+# rejects constructs that mmdc would certainly reject, so a diagram that passes
+# here still goes through the real renderer.
+
+FLOWCHART_DIRECTIONS = {"TB", "TD", "BT", "RL", "LR"}
+
+BRACKET_PAIRS = {"(": ")", "[": "]", "{": "}"}
+CLOSING_BRACKETS = {v: k for k, v in BRACKET_PAIRS.items()}
+
+SEQUENCE_BLOCK_OPENERS = {"alt", "opt", "loop", "par", "critical", "break", "rect", "box"}
+SEQUENCE_BLOCK_BRANCHES = {"else": "alt", "and": "par", "option": "critical"}
+# Mermaid's sequence lexer is case-insensitive, so these are matched lowercased
+SEQUENCE_KEYWORDS = {
+    "participant", "actor", "create", "destroy", "note", "activate", "deactivate",
+    "autonumber", "title", "acctitle", "accdescr", "links", "link", "properties", "details",
+}
+SEQUENCE_MESSAGE = re.compile(
+    r"^(?P<source>.+?)\s*(?P<arrow><<-->>|<<->>|-->>|->>|-->|->|--x|-x|--\)|-\))\s*[+-]?\s*(?P<target>[^:]+?)\s*(:.*)?$"
+)
+
+def _syntax_error(line_no: int, col: int, message: str, line: str) -> str:
+    """Formats a precise error the same way the retry prompt quotes CLI errors."""
+    return (
+        f"Mermaid Syntax Error:\nLine {line_no}, column {col}: {message}\n"
+        f"    {line}\n    {' ' * (col - 1)}^"
+    )
+
+def _first_token(line: str) -> str:
+    match = re.match(r"[A-Za-z0-9_\-]+", line.strip())
+    return match.group(0) if match else ""
+
+def _header_index(lines: List[str]) -> Optional[int]:
+    """Finds the diagram header line, skipping front matter, directives and comments."""
+    in_front_matter = False
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if i == 0 and stripped == "---":
+            in_front_matter = True
+            continue
+        if in_front_matter:
+            if stripped == "---":
+                in_front_matter = False
+            continue
+        if not stripped or stripped.startswith("%%"):
+            continue
+        return i
+    return None
+
+def _check_flowchart(lines: List[str], start: int) -> str:
+    stack = []          # (bracket, line_no, col)
+    quote_open = None   # (line_no, col)
+    block_stack = []    # (line_no, col) of open subgraphs
+
+    for i in range(start, len(lines)):
+        line = lines[i]
+        line_no = i + 1
+        stripped = line.strip()
+        if not stripped or stripped.startswith("%%"):
+            continue
+
+        # Blank out quoted and bracketed text so arrow checks only see the
+        # statement skeleton.
+        skeleton = []
+        in_label = False
+        prev = ""
+        for j, ch in enumerate(line):
+            col = j + 1
+            if quote_open is not None:
+                if ch == '"':
+                    quote_open = None
+                skeleton.append(" ")
+            elif ch == '"':
+                quote_open = (line_no, col)
+                skeleton.append(" ")
+            elif ch == "|" and not stack:
+                in_label = not in_label
+                skeleton.append(" ")
+            elif in_label:
+                skeleton.append(" ")
+            elif ch in BRACKET_PAIRS:
+                stack.append((ch, line_no, col))
+                skeleton.append(" ")
+            elif ch == ">" and not stack and re.match(r"[A-Za-z0-9_]", prev):
+                # Asymmetric node shape: A>label]
+                stack.append(("[", line_no, col))
+                skeleton.append(" ")
+            elif ch in CLOSING_BRACKETS:
+                if not stack:
+                    return _syntax_error(line_no, col, f"Unbalanced '{ch}' has no matching opening bracket.", line)
+                opener, _, _ = stack.pop()
+                if BRACKET_PAIRS[opener] != ch:
+                    return _syntax_error(line_no, col, f"Expected '{BRACKET_PAIRS[opener]}' to close '{opener}' but found '{ch}'.", line)
+                skeleton.append(" ")
+            else:
+                skeleton.append(" " if stack else ch)
+            prev = ch
+
+        if in_label:
+            return _syntax_error(line_no, line.index("|") + 1, "Unterminated edge label '|'.", line)
+
+        skeleton = "".join(skeleton)
+        for pattern, token, hint in (
+            (r"(?<![-.=<])->", "->", "use '-->'"),
+            (r"(?<![=])=>", "=>", "use '==>'"),
+        ):
+            match = re.search(pattern, skeleton)
+            if match:
+                return _syntax_error(line_no, match.start() + 1, f"Invalid arrow '{token}', {hint}.", line)
+
+        keyword = _first_token(skeleton)
+        if keyword == "subgraph":
+            block_stack.append((line_no, line.index("subgraph") + 1))
+        elif keyword == "end" and not stack:
+            if not block_stack:
+                return _syntax_error(line_no, line.index("end") + 1, "'end' without a matching 'subgraph'.", line)
+            block_stack.pop()
+
+    if quote_open is not None:
+        line_no, col = quote_open
+        return _syntax_error(line_no, col, "Unterminated string '\"'.", lines[line_no - 1])
+    if stack:
+        opener, line_no, col = stack[-1]
+        return _syntax_error(line_no, col, f"Unclosed '{opener}'.", lines[line_no - 1])
+    if block_stack:
+        line_no, col = block_stack[-1]
+        return _syntax_error(line_no, col, "'subgraph' is missing its closing 'end'.", lines[line_no - 1])
+    return ""
+
+def _check_sequence(lines: List[str], start: int) -> str:
+    block_stack = []  # (keyword, line_no, col)
+
+    for i in range(start, len(lines)):
+        line = lines[i]
+        line_no = i + 1
+        stripped = line.strip()
+        if not stripped or stripped.startswith("%%"):
+            continue
+        col = len(line) - len(line.lstrip()) + 1
+        keyword = _first_token(stripped).lower()
+
+        if keyword in SEQUENCE_BLOCK_OPENERS:
+            block_stack.append((keyword, line_no, col))
+        elif keyword in SEQUENCE_BLOCK_BRANCHES:
+            expected = SEQUENCE_BLOCK_BRANCHES[keyword]
+            if not block_stack or block_stack[-1][0] != expected:
+                return _syntax_error(line_no, col, f"'{keyword}' is only allowed inside an '{expected}' block.", line)
+        elif keyword == "end":
+            if not block_stack:
+                return _syntax_error(line_no, col, "'end' without a matching block opener.", line)
+            block_stack.pop()
+        elif keyword in SEQUENCE_KEYWORDS:
+            continue
+        elif not SEQUENCE_MESSAGE.match(stripped):
+            return _syntax_error(
+                line_no, col,
+                "Unrecognized statement or invalid arrow token "
+                "(expected ->>, -->>, ->, -->, -x, --x, -), --) or a sequenceDiagram keyword).",
+                line,
+            )
+
+    if block_stack:
+        keyword, line_no, col = block_stack[-1]
+        return _syntax_error(line_no, col, f"'{keyword}' block is missing its closing 'end'.", lines[line_no - 1])
+    return ""
+
+def precheck_mermaid_syntax(mermaid_code: str) -> str:
+    """
+    Fast in-process syntax check for flowchart/graph and sequenceDiagram sources.
+    Other diagram types, including ones newer than this checker, are left to
+    the renderer. Returns empty string if nothing is obviously wrong, or a
+    line/column precise error message.
+    """
+    lines = mermaid_code.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip().startswith("```"):
+            return _syntax_error(i + 1, line.index("```") + 1, "Stray markdown code fence inside the diagram.", line)
+
+    start = _header_index(lines)
+    if start is None:
+        return "Mermaid Syntax Error:\nDiagram has no header line."
+
+    header_line = lines[start]
+    header = header_line.strip().rstrip(";")
+    parts = header.split()
+    diagram_type = parts[0]
+
+    if diagram_type in ("graph", "flowchart", "flowchart-elk"):
+        if len(parts) > 1 and parts[1].rstrip(";") not in FLOWCHART_DIRECTIONS:
+            return _syntax_error(start + 1, header_line.index(parts[1]) + 1, f"Unknown flowchart direction '{parts[1]}', expected one of TB, TD, BT, RL, LR.", header_line)
+        return _check_flowchart(lines, start + 1)
+    if diagram_type == "sequenceDiagram":
+        return _check_sequence(lines, start + 1)
+    return ""
+
+# Output that only Mermaid's parser produces for a broken diagram. Any other
+# renderer failure (Chromium launch, puppeteer timeouts, OOM kills) says nothing
+# about the diagram and must not be cached as its result.
+DIAGRAM_ERROR = re.compile(
+    r"Parse error on line|Lexical error|Syntax error in text|UnknownDiagramError|No diagram type detected",
+    re.IGNORECASE,
+)
 
+def _is_diagram_error(output: str) -> bool:
+    return bool(DIAGRAM_ERROR.search(output or ""))
+
+def _read_svg(path: str) -> str:
+    if not os.path.exists(path):
+        return ""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def _validate_with_mmdc(mermaid_code: str) -> Tuple[str, bool, str]:
+    """
+    Cold-start path: writes to a temp file, runs mmdc, and returns
+    (error, definitive, svg). The error is empty if valid; definitive is False
+    when the outcome says nothing about the diagram itself (e.g. mmdc is missing,
+    or the browser failed rather than Mermaid's parser).
+    """
     # Create temporary files for input and output
     with tempfile.NamedTemporaryFile(mode='w', suffix='.mmd', delete=False) as temp_in:
         temp_in.write(mermaid_code)
         temp_in_path = temp_in.name
-    
+
     temp_out_path = temp_in_path + ".svg"
 
     try:
@@ -34,21 +255,239 @@ def validate_mermaid_syntax(mermaid_code: str) -> str:
             ['mmdc', '-i', temp_in_path, '-o', temp_out_path],
             capture_output=True,
             text=True,
-            check=False 
+            check=False
         )
 
         if result.returncode != 0:
-            return f"Mermaid CLI Error:\n{result.stderr}\nOutput:\n{result.stdout}"
-        
-        return "" # Empty string means success
-        
+            output = f"{result.stderr}\n{result.stdout}"
+            return f"Mermaid CLI Error:\n{result.stderr}\nOutput:\n{result.stdout}", _is_diagram_error(output), ""
+
+        return "", True, _read_svg(temp_out_path) # Empty string means success
+
     except FileNotFoundError:
-        return "Error: 'mmdc' command not found. Ensure @mermaid-js/mermaid-cli is installed."
+        return "Error: 'mmdc' command not found. Ensure @mermaid-js/mermaid-cli is installed.", False, ""
     except Exception as e:
-        return f"Unexpected error during validation: {str(e)}"
+        return f"Unexpected error during validation: {str(e)}", False, ""
     finally:
         # Cleanup temp files
         if os.path.exists(temp_in_path):
             os.remove(temp_in_path)
         if os.path.exists(temp_out_path):
             os.remove(temp_out_path)
+
+_renderer_version: Optional[str] = None
+_renderer_version_lock = threading.Lock()
+
+def _use_fake_renderer() -> bool:
+    return os.environ.get("MERMAID_RENDERER", "mmdc") == "fake"
+
+def renderer_version() -> str:
+    """Version of the Mermaid renderer, part of every validation cache key."""
+    global _renderer_version
+    if _use_fake_renderer():
+        return fake_renderer.VERSION
+    with _renderer_version_lock:
+        if _renderer_version is None:
+            worker = get_worker()
+            if worker is not None and worker.version:
+                _renderer_version = f"mermaid-cli {worker.version}"
+            else:
+                try:
+                    result = subprocess.run(['mmdc', '--version'], capture_output=True, text=True, check=False)
+                    _renderer_version = f"mermaid-cli {result.stdout.strip()}"
+                except FileNotFoundError:
+                    _renderer_version = ""
+        return _renderer_version
+
+def _render_diagram(mermaid_code: str) -> Tuple[str, bool, str]:
+    """Renders one diagram, preferring the warm worker. Returns (error, definitive, svg)."""
+    if _use_fake_renderer():
+        with metrics.span("mermaid.render", renderer="fake"):
+            error, svg = fake_renderer.fake_render(mermaid_code)
+        return (f"Mermaid CLI Error:\n{error}" if error else ""), not error or _is_diagram_error(error), svg
+
+    worker = get_worker()
+    if worker is not None:
+        try:
+            with metrics.span("mermaid.render", renderer="worker"):
+                error, svg = worker.render(mermaid_code)
+        except Exception as e:
+            print(f"Mermaid worker render failed ({e}). Falling back to mmdc.")
+        else:
+            return (f"Mermaid CLI Error:\n{error}" if error else ""), not error or _is_diagram_error(error), ("" if error else svg)
+
+    with metrics.span("mermaid.render", renderer="mmdc"):
+        return _validate_with_mmdc(mermaid_code)
+
+def _prepare_diagram(mermaid_code: str) -> Tuple[str, str]:
+    """Strips code fences and runs the cheap in-process checks. Returns (code, error)."""
+    if not mermaid_code or not mermaid_code.strip():
+        return mermaid_code, "Mermaid code is empty."
+
+    mermaid_code = _strip_code_fences(mermaid_code)
+
+    # Reject obviously broken diagrams before paying for a browser render
+    return mermaid_code, precheck_mermaid_syntax(mermaid_code)
+
+def _cache_get(mermaid_code: str, version: str) -> Optional[str]:
+    cache = get_validation_cache()
+    # Without a known renderer version a cached result could be stale, so skip the cache
+    if cache is None or not version:
+        return None
+    return cache.get(diagram_key(mermaid_code, version))
+
+def _cache_put(mermaid_code: str, version: str, error: str, definitive: bool, svg: str = ""):
+    if not version:
+        return
+    key = diagram_key(mermaid_code, version)
+    # Keep what the validation render produced so the site build never renders it again
+    store = get_svg_store()
+    if svg and store is not None:
+        store.put(key, svg)
+    cache = get_validation_cache()
+    if cache is not None and definitive:
+        cache.put(key, error)
+
+def validate_mermaid_syntax(mermaid_code: str) -> str:
+    """
+    Validates Mermaid syntax by rendering it with @mermaid-js/mermaid-cli.
+    Diagrams failing the in-process pre-check never reach the renderer, and
+    rendered results are cached on disk by content hash. Uses the warm renderer
+    worker when available and falls back to one mmdc subprocess per diagram
+    otherwise. Returns empty string if valid, or the error message if invalid.
+    """
+    mermaid_code, error = _prepare_diagram(mermaid_code)
+    if error:
+        metrics.incr("mermaid.precheck_rejected")
+        return error
+
+    version = renderer_version()
+    cached = _cache_get(mermaid_code, version)
+    if cached is not None:
+        metrics.incr("mermaid.cache_hit")
+        return cached
+
+    error, definitive, svg = _render_diagram(mermaid_code)
+    _cache_put(mermaid_code, version, error, definitive, svg)
+    return error
+
+def validate_mermaid_batch(diagrams: Dict[str, str]) -> Dict[str, str]:
+    """
+    Validates several diagrams concurrently.
+    Returns a mapping of the same keys to their error message ("" when valid).
+    """
+    if not diagrams:
+        return {}
+    names = list(diagrams)
+
+    def _validate(name):
+        with metrics.span("mermaid.validate", diagram=name):
+            return validate_mermaid_syntax(diagrams[name])
+
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        results = pool.map(metrics.in_current_context(_validate), names)
+        return dict(zip(names, results))
+
+def render_mermaid_svg(mermaid_code: str) -> Tuple[Optional[str], str]:
+    """
+    Returns (svg, key) for a diagram, reusing the SVG kept by validation and
+    rendering only when it is missing (e.g. a result cached before SVGs were
+    kept, or MERMAID_CACHE=0). svg is None when the diagram is invalid (including a failure already
+    in the validation cache) or no renderer is available.
+    """
+    mermaid_code, error = _prepare_diagram(mermaid_code)
+    version = renderer_version()
+    if error or not version:
+        return None, ""
+    key = diagram_key(mermaid_code, version)
+    store = get_svg_store()
+    svg = store.get(key) if store is not None else None
+    if svg is None:
+        if _cache_get(mermaid_code, version):
+            # Known to fail: rendering it again would only repeat the error
+            return None, ""
+        error, definitive, svg = _render_diagram(mermaid_code)
+        _cache_put(mermaid_code, version, error, definitive, svg)
+    return (svg or None), key
+
+# --- Async variants ---
+
+async def _avalidate_with_mmdc(mermaid_code: str) -> Tuple[str, bool, str]:
+    """Async twin of _validate_with_mmdc using a non-blocking subprocess."""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.mmd', delete=False) as temp_in:
+        temp_in.write(mermaid_code)
+        temp_in_path = temp_in.name
+
+    temp_out_path = temp_in_path + ".svg"
+
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            'mmdc', '-i', temp_in_path, '-o', temp_out_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+
+        if proc.returncode != 0:
+            stderr, stdout = stderr.decode(errors='replace'), stdout.decode(errors='replace')
+            return f"Mermaid CLI Error:\n{stderr}\nOutput:\n{stdout}", _is_diagram_error(f"{stderr}\n{stdout}"), ""
+
+        return "", True, _read_svg(temp_out_path)
+
+    except FileNotFoundError:
+        return "Error: 'mmdc' command not found. Ensure @mermaid-js/mermaid-cli is installed.", False, ""
+    except Exception as e:
+        return f"Unexpected error during validation: {str(e)}", False, ""
+    finally:
+        if os.path.exists(temp_in_path):
+            os.remove(temp_in_path)
+        if os.path.exists(temp_out_path):
+            os.remove(temp_out_path)
+
+async def _arender_diagram(mermaid_code: str) -> Tuple[str, bool, str]:
+    if _use_fake_renderer():
+        with metrics.span("mermaid.render", renderer="fake"):
+            error, svg = await fake_renderer.afake_render(mermaid_code)
+        return (f"Mermaid CLI Error:\n{error}" if error else ""), not error or _is_diagram_error(error), svg
+
+    # Starting the worker blocks until Chromium is up, so do it off the event loop
+    worker = await asyncio.to_thread(get_worker)
+    if worker is not None:
+        try:
+            with metrics.span("mermaid.render", renderer="worker"):
+                error, svg = await asyncio.wait_for(asyncio.wrap_future(worker.submit(mermaid_code)), RENDER_TIMEOUT)
+        except Exception as e:
+            print(f"Mermaid worker render failed ({e}). Falling back to mmdc.")
+        else:
+            return (f"Mermaid CLI Error:\n{error}" if error else ""), not error or _is_diagram_error(error), ("" if error else svg)
+
+    with metrics.span("mermaid.render", renderer="mmdc"):
+        return await _avalidate_with_mmdc(mermaid_code)
+
+async def avalidate_mermaid_syntax(mermaid_code: str) -> str:
+    """Async version of validate_mermaid_syntax."""
+    mermaid_code, error = _prepare_diagram(mermaid_code)
+    if error:
+        metrics.incr("mermaid.precheck_rejected")
+        return error
+
+    version = await asyncio.to_thread(renderer_version)
+    cached = _cache_get(mermaid_code, version)
+    if cached is not None:
+        metrics.incr("mermaid.cache_hit")
+        return cached
+
+    error, definitive, svg = await _arender_diagram(mermaid_code)
+    _cache_put(mermaid_code, version, error, definitive, svg)
+    return error
+
+async def avalidate_mermaid_batch(diagrams: Dict[str, str]) -> Dict[str, str]:
+    """Async version of validate_mermaid_batch."""
+    names = list(diagrams)
+
+    async def _validate(name):
+        with metrics.span("mermaid.validate", diagram=name):
+            return await avalidate_mermaid_syntax(diagrams[name])
+
+    results = await asyncio.gather(*(_validate(n) for n in names))
+    return dict(zip(names, results))
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+CACHE_PATH = os.environ.get("MERMAID_CACHE_PATH", os.path.join(".cache", "mermaid_validation.sqlite"))
+CACHE_MAX_ENTRIES = int(os.environ.get("MERMAID_CACHE_MAX_ENTRIES", "5000"))
+SVG_DIR = os.environ.get("MERMAID_SVG_DIR", os.path.join(".cache", "mermaid_svg"))
+SVG_MAX_ENTRIES = int(os.environ.get("MERMAID_SVG_MAX_ENTRIES", str(CACHE_MAX_ENTRIES)))
+
+
+def normalize_diagram(mermaid_code: str) -> str:
+    """Normalizes whitespace that does not change how Mermaid parses a diagram."""
+    lines = mermaid_code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def diagram_key(mermaid_code: str, renderer_version: str) -> str:
+    """Content address of a diagram for a given renderer version."""
+    payload = f"{renderer_version}\0{normalize_diagram(mermaid_code)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MermaidValidationCache:
+    """
+    On-disk, size-bounded LRU cache of Mermaid validation results.
+    Entries are keyed by diagram_key(), so a renderer upgrade naturally
+    invalidates every previous result.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS validations ("
+            " key TEXT PRIMARY KEY,"
+            " error TEXT NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_validations_access ON validations(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached error message ("" for a valid diagram), or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT error FROM validations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE validations SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, error: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validations (key, error, last_access) VALUES (?, ?, ?)",
+                (key, error, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM validations").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM validations WHERE key IN"
+                " (SELECT key FROM validations ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM validations").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class SvgStore:
+    """
+    Rendered diagrams on disk, one <diagram_key>.svg per diagram. Keys include
+    the renderer version, so a file never has to be invalidated, only replaced.
+    Bounded like the validation cache: reads refresh a file's mtime and the
+    least recently used files are deleted beyond max_entries.
+    """
+
+    def __init__(self, directory: str = SVG_DIR, max_entries: int = SVG_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.svg")
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                svg = f.read()
+            os.utime(self.path(key))
+            return svg
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, svg: str):
+        # Write-then-rename so concurrent renders of the same diagram never expose a partial file
+        tmp_path = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(svg)
+        os.replace(tmp_path, self.path(key))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".svg"):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass  # Evicted by another process meanwhile
+            overflow = len(entries) - self.max_entries
+            for _, path in sorted(entries)[:max(0, overflow)]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+_cache: Optional[MermaidValidationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_validation_cache() -> Optional[MermaidValidationCache]:
+    """Returns the process-wide cache, or None when disabled with MERMAID_CACHE=0."""
+    global _cache
+    if os.environ.get("MERMAID_CACHE", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = MermaidValidationCache()
+        return _cache
+
+
+_svg_store: Optional[SvgStore] = None
+
+
+def get_svg_store() -> Optional[SvgStore]:
+    """Returns the process-wide store of rendered SVGs, or None when MERMAID_CACHE=0."""
+    global _svg_store
+    if os.environ.get("MERMAID_CACHE", "1") == "0":
+        return None
+    with _cache_lock:
+        if _svg_store is None:
+            _svg_store = SvgStore()
+        return _svg_store
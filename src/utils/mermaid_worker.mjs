@@ -0,0 +1,86 @@
+// Long-lived Mermaid render worker.
+//
+// Keeps one headless Chromium instance warm and renders diagrams fed over
+// stdin, one JSON request per line: {"id": 1, "code": "graph TD ..."}.
+// Every request is answered on stdout with {"id": 1, "error": "", "svg": "..."}.
+// The first line written is {"ready": true, "version": "<mermaid-cli version>"},
+// or {"fatal": "<reason>"} if the renderer could not be started.
+
+import { createInterface } from 'node:readline';
+import { createRequire } from 'node:module';
+import { execSync } from 'node:child_process';
+import { readFileSync } from 'node:fs';
+import { join } from 'node:path';
+import { pathToFileURL } from 'node:url';
+
+const MAX_CONCURRENCY = Number(process.env.MERMAID_WORKER_CONCURRENCY || 4);
+
+function send(message) {
+  process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+function resolveMermaidCli() {
+  const root = process.env.MERMAID_CLI_ROOT || execSync('npm root -g').toString().trim();
+  const pkgDir = join(root, '@mermaid-js', 'mermaid-cli');
+  const pkg = JSON.parse(readFileSync(join(pkgDir, 'package.json'), 'utf8'));
+  let entry = (pkg.exports && pkg.exports['.']) || pkg.main || 'src/index.js';
+  if (typeof entry === 'object') entry = entry.import || entry.default;
+  return { pkgDir, entry: join(pkgDir, entry), version: pkg.version };
+}
+
+async function start() {
+  const { pkgDir, entry, version } = resolveMermaidCli();
+  const { renderMermaid } = await import(pathToFileURL(entry).href);
+
+  // Use the puppeteer copy mermaid-cli was installed with.
+  const require = createRequire(join(pkgDir, 'package.json'));
+  const puppeteerModule = await import(pathToFileURL(require.resolve('puppeteer')).href);
+  const puppeteer = puppeteerModule.default || puppeteerModule;
+
+  let launchOptions = { headless: true };
+  if (process.env.MERMAID_PUPPETEER_CONFIG) {
+    launchOptions = { ...launchOptions, ...JSON.parse(readFileSync(process.env.MERMAID_PUPPETEER_CONFIG, 'utf8')) };
+  }
+  const browser = await puppeteer.launch(launchOptions);
+
+  let active = 0;
+  const waiting = [];
+
+  async function render(request) {
+    active += 1;
+    try {
+      const { data } = await renderMermaid(browser, request.code, 'svg');
+      send({ id: request.id, error: '', svg: Buffer.from(data).toString('utf8') });
+    } catch (err) {
+      send({ id: request.id, error: String((err && err.message) || err), svg: '' });
+    } finally {
+      active -= 1;
+      if (waiting.length > 0) render(waiting.shift());
+    }
+  }
+
+  const rl = createInterface({ input: process.stdin });
+  rl.on('line', (line) => {
+    if (!line.trim()) return;
+    let request;
+    try {
+      request = JSON.parse(line);
+    } catch (err) {
+      send({ id: null, error: `Malformed request: ${err.message}`, svg: '' });
+      return;
+    }
+    if (active < MAX_CONCURRENCY) render(request);
+    else waiting.push(request);
+  });
+  rl.on('close', async () => {
+    await browser.close();
+    process.exit(0);
+  });
+
+  send({ ready: true, version });
+}
+
+start().catch((err) => {
+  send({ fatal: String((err && err.message) || err) });
+  process.exit(1);
+});
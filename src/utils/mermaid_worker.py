@@ -0,0 +1,162 @@
+import atexit
+import itertools
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional, Tuple
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mermaid_worker.mjs")
+STARTUP_TIMEOUT = float(os.environ.get("MERMAID_WORKER_STARTUP_TIMEOUT", "60"))
+RENDER_TIMEOUT = float(os.environ.get("MERMAID_WORKER_RENDER_TIMEOUT", "30"))
+
+
+class MermaidWorker:
+    """
+    Client for the long-lived Node renderer in mermaid_worker.mjs.
+    One process (and one warm Chromium) serves every validation in this Python
+    process; requests are multiplexed over stdin/stdout by id, so callers on
+    different threads can render concurrently.
+    """
+
+    def __init__(self, script_path: str = WORKER_SCRIPT):
+        self.script_path = script_path
+        self.version = ""
+        self._proc: Optional[subprocess.Popen] = None
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count(1)
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+
+    def start(self):
+        self._proc = subprocess.Popen(
+            ["node", self.script_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        ready: Future = Future()
+        threading.Thread(target=self._read_loop, args=(ready,), daemon=True).start()
+        try:
+            hello = ready.result(timeout=STARTUP_TIMEOUT)
+        except FutureTimeoutError:
+            self.close()
+            raise RuntimeError("Mermaid worker did not become ready in time.")
+        if "fatal" in hello:
+            self.close()
+            raise RuntimeError(f"Mermaid worker failed to start: {hello['fatal']}")
+        self.version = hello.get("version", "")
+
+    def _read_loop(self, ready: Future):
+        for line in self._proc.stdout:
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not ready.done():
+                ready.set_result(message)
+                continue
+            with self._pending_lock:
+                future = self._pending.pop(message.get("id"), None)
+            if future is not None and not future.done():
+                try:
+                    future.set_result((message.get("error", ""), message.get("svg", "")))
+                except InvalidStateError:
+                    pass  # Cancelled by a caller that gave up meanwhile
+
+        # stdout closed: the worker exited, so nothing pending will be answered.
+        if not ready.done():
+            ready.set_result({"fatal": "worker exited during startup"})
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError("Mermaid worker exited."))
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def submit(self, code: str) -> Future:
+        """Queues a diagram for rendering. The future resolves to (error, svg)."""
+        future: Future = Future()
+        request_id = next(self._ids)
+        with self._pending_lock:
+            self._pending[request_id] = future
+        # A caller that gives up cancels the future (render() on timeout, asyncio.wait_for via
+        # wrap_future); forget it then, or a reply that never comes would keep it forever
+        future.add_done_callback(lambda f: f.cancelled() and self._forget(request_id))
+        try:
+            with self._write_lock:
+                self._proc.stdin.write(json.dumps({"id": request_id, "code": code}) + "\n")
+                self._proc.stdin.flush()
+        except (OSError, ValueError) as e:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            future.set_exception(RuntimeError(f"Mermaid worker unavailable: {e}"))
+        return future
+
+    def _forget(self, request_id: int):
+        with self._pending_lock:
+            self._pending.pop(request_id, None)
+
+    def render(self, code: str, timeout: float = RENDER_TIMEOUT) -> Tuple[str, str]:
+        future = self.submit(code)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def close(self):
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=5)
+        except Exception:
+            self._proc.kill()
+        self._proc = None
+
+
+_worker: Optional[MermaidWorker] = None
+_worker_failed = False
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> Optional[MermaidWorker]:
+    """
+    Returns the process-wide warm renderer, starting it on first use.
+    Returns None when the worker is disabled (MERMAID_WORKER=0) or cannot be
+    started, in which case callers fall back to one mmdc subprocess per diagram.
+    """
+    global _worker, _worker_failed
+    if os.environ.get("MERMAID_WORKER", "1") == "0":
+        return None
+    with _worker_lock:
+        if _worker is not None and _worker.alive:
+            return _worker
+        if _worker_failed:
+            return None
+        worker = MermaidWorker()
+        try:
+            worker.start()
+        except (OSError, RuntimeError) as e:
+            print(f"Mermaid worker unavailable ({e}). Falling back to mmdc per diagram.")
+            _worker_failed = True
+            return None
+        _worker = worker
+        return _worker
+
+
+@atexit.register
+def shutdown_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.close()
+            _worker = None
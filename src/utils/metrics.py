@@ -0,0 +1,246 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+REPORT_FILENAME = "run_report.json"
+PROMETHEUS_FILE = os.environ.get("METRICS_PROMETHEUS_FILE", "")
+
+# The collector of the run being executed. LangGraph copies the context into
+# the threads/tasks it runs nodes on, so spans recorded anywhere below a node
+# land in the right run even when several runs share one process (batch).
+_current_run: contextvars.ContextVar[Optional["RunMetrics"]] = contextvars.ContextVar("current_run", default=None)
+_current_node: contextvars.ContextVar[str] = contextvars.ContextVar("current_node", default="")
+# time.monotonic() when the current node started, for node-level deadlines
+_node_started: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("node_started", default=None)
+
+
+class RunMetrics:
+    """Spans, token usage and counters of one workflow run."""
+
+    def __init__(self, run_id: str = "", topic: str = ""):
+        self.run_id = run_id
+        self.topic = topic
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._t0 = time.monotonic()
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, int] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}  # node -> input/output/total
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, node: str, start: float, duration: float, error: str = "", **attrs):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "node": node,
+                "start_offset": round(start - self._t0, 4),
+                "duration_seconds": round(duration, 4),
+                "error": error,
+                "attributes": attrs,
+            })
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_tokens(self, node: str, usage: Dict[str, int]):
+        with self._lock:
+            totals = self.tokens.setdefault(node, {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0})
+            for key in totals:
+                totals[key] += int(usage.get(key, 0) or 0)
+
+    def node_summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per-node aggregates: node wall time, LLM time and tokens, renderer time."""
+        with self._lock:
+            spans = list(self.spans)
+            tokens = {k: dict(v) for k, v in self.tokens.items()}
+        summary: Dict[str, Dict[str, Any]] = {}
+        for span in spans:
+            entry = summary.setdefault(span["node"] or "-", {
+                "calls": 0, "seconds": 0.0, "max_seconds": 0.0, "errors": 0,
+                "llm_calls": 0, "llm_seconds": 0.0, "render_calls": 0, "render_seconds": 0.0,
+            })
+            duration = span["duration_seconds"]
+            if span["name"] == "node":
+                entry["calls"] += 1
+                entry["seconds"] += duration
+                entry["max_seconds"] = max(entry["max_seconds"], duration)
+                entry["errors"] += 1 if span["error"] else 0
+            elif span["name"] == "llm":
+                entry["llm_calls"] += 1
+                entry["llm_seconds"] += duration
+            elif span["name"] == "mermaid.render":
+                entry["render_calls"] += 1
+                entry["render_seconds"] += duration
+        for node, usage in tokens.items():
+            summary.setdefault(node, {}).update(usage)
+        for entry in summary.values():
+            for key in ("seconds", "max_seconds", "llm_seconds", "render_seconds"):
+                if key in entry:
+                    entry[key] = round(entry[key], 3)
+        return summary
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            spans = list(self.spans)
+        return {
+            "run_id": self.run_id,
+            "topic": self.topic,
+            "started_at": self.started_at,
+            "wall_seconds": round(time.monotonic() - self._t0, 3),
+            "nodes": self.node_summary(),
+            "counters": counters,
+            "spans": spans,
+        }
+
+    def write_report(self, output_dir: str) -> str:
+        """Writes the JSON report into the run's output directory. Returns its path."""
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, REPORT_FILENAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+    def summary_table(self) -> str:
+        rows = self.node_summary()
+        header = f"{'NODE':<24} {'CALLS':>5} {'TIME s':>8} {'MAX s':>7} {'LLM':>4} {'LLM s':>7} {'IN TOK':>8} {'OUT TOK':>8} {'RENDER s':>9}"
+        lines = [header, "-" * len(header)]
+        for node, row in sorted(rows.items(), key=lambda item: -item[1].get("seconds", 0)):
+            lines.append(
+                f"{node:<24} {row.get('calls', 0):>5} {row.get('seconds', 0):>8.2f} {row.get('max_seconds', 0):>7.2f}"
+                f" {row.get('llm_calls', 0):>4} {row.get('llm_seconds', 0):>7.2f} {row.get('input_tokens', 0):>8}"
+                f" {row.get('output_tokens', 0):>8} {row.get('render_seconds', 0):>9.2f}"
+            )
+        lines.append(f"Wall time: {time.monotonic() - self._t0:.2f}s")
+        counters = self.report()["counters"]
+        if counters:
+            lines.append("Counters: " + ", ".join(f"{k}={v}" for k, v in sorted(counters.items())))
+        return "\n".join(lines)
+
+
+def write_prometheus_textfile(metrics: RunMetrics, path: str):
+    """Exports the per-node aggregates in the node_exporter textfile format."""
+    topic = metrics.topic.replace("\\", "\\\\").replace('"', '\\"')
+    labels = lambda node: f'node="{node}",topic="{topic}"'
+    lines = [
+        "# HELP zuta_node_seconds Total wall time spent in a graph node.",
+        "# TYPE zuta_node_seconds gauge",
+        "# HELP zuta_llm_seconds Time spent waiting on the LLM per node.",
+        "# TYPE zuta_llm_seconds gauge",
+        "# HELP zuta_llm_tokens Tokens used per node and direction.",
+        "# TYPE zuta_llm_tokens gauge",
+        "# HELP zuta_counter Run counters (JSON recovery paths, diagram attempts, cache hits).",
+        "# TYPE zuta_counter gauge",
+    ]
+    for node, row in metrics.node_summary().items():
+        lines.append(f"zuta_node_seconds{{{labels(node)}}} {row.get('seconds', 0)}")
+        lines.append(f"zuta_llm_seconds{{{labels(node)}}} {row.get('llm_seconds', 0)}")
+        for direction in ("input", "output"):
+            lines.append(f"zuta_llm_tokens{{{labels(node)},direction=\"{direction}\"}} {row.get(f'{direction}_tokens', 0)}")
+    for name, value in sorted(metrics.report()["counters"].items()):
+        lines.append(f'zuta_counter{{name="{name}",topic="{topic}"}} {value}')
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    # node_exporter may read at any moment, so replace the file atomically
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def bind_run(metrics: RunMetrics):
+    """Makes metrics the collector for everything executed inside the block."""
+    token = _current_run.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_run.reset(token)
+
+
+def current_run() -> Optional[RunMetrics]:
+    return _current_run.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the block as a span of the current node. A no-op outside a bound run."""
+    metrics = _current_run.get()
+    if metrics is None:
+        yield
+        return
+    start = time.monotonic()
+    error = ""
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        metrics.add_span(name, _current_node.get(), start, time.monotonic() - start, error, **attrs)
+
+
+def incr(name: str, n: int = 1):
+    metrics = _current_run.get()
+    if metrics is not None:
+        metrics.incr(name, n)
+
+
+def record_usage(message):
+    """Adds the usage_metadata of a model response to the current node's token totals."""
+    metrics = _current_run.get()
+    usage = getattr(message, "usage_metadata", None)
+    if metrics is not None and usage:
+        metrics.add_tokens(_current_node.get(), usage)
+
+
+def node_started() -> Optional[float]:
+    """Monotonic start time of the node being executed, or None outside an instrumented node."""
+    return _node_started.get()
+
+
+def instrument_node(name: str, func: Callable) -> Callable:
+    """Wraps a sync node so it runs as a timed 'node' span."""
+    def wrapper(state):
+        token = _current_node.set(name)
+        started_token = _node_started.set(time.monotonic())
+        try:
+            with span("node"):
+                return func(state)
+        finally:
+            _node_started.reset(started_token)
+            _current_node.reset(token)
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+def ainstrument_node(name: str, afunc: Callable) -> Callable:
+    """Async twin of instrument_node."""
+    async def wrapper(state):
+        token = _current_node.set(name)
+        started_token = _node_started.set(time.monotonic())
+        try:
+            with span("node"):
+                return await afunc(state)
+        finally:
+            _node_started.reset(started_token)
+            _current_node.reset(token)
+    wrapper.__name__ = afunc.__name__
+    return wrapper
+
+
+def in_current_context(func: Callable) -> Callable:
+    """
+    Binds func to the caller's context (current run and node) for use on a
+    plain thread pool, which unlike LangGraph does not propagate contextvars.
+    """
+    context = contextvars.copy_context()
+    # One copy per call: a Context cannot be entered by two threads at once
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
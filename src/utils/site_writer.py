@@ -0,0 +1,94 @@
+import hashlib
+import os
+import stat
+import tempfile
+from typing import Dict, List
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read_umask() -> int:
+    # Reading the umask means setting it; done once at import, before worker threads start
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _read_umask()
+
+
+def _file_mode(path: str) -> int:
+    """Mode of the file being replaced, or what a plain open() would create (0666 minus the umask)."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write(path: str, content: str):
+    """Writes via a temp file in the same directory and renames it over the target."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        # mkstemp creates 0600 files; give the result the usual permissions instead
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    Atomically writes content unless the file already holds exactly the same
+    bytes, so unchanged pages keep their mtime. Returns True if it wrote.
+    """
+    new_hash = _sha256(content.encode("utf-8"))
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if _sha256(f.read()) == new_hash:
+                return False
+    atomic_write(path, content)
+    return True
+
+
+def write_site(output_dir: str, files: Dict[str, str]) -> List[str]:
+    """Writes a {relative path: content} map under output_dir. Returns the paths that changed."""
+    return [rel for rel, content in files.items() if write_if_changed(os.path.join(output_dir, rel), content)]
+
+
+def prune_dir(output_dir: str, subdir: str, files: Dict[str, str]) -> List[str]:
+    """Deletes files under output_dir/subdir that are not in the site's file map. Returns their paths."""
+    directory = os.path.join(output_dir, subdir)
+    if not os.path.isdir(directory):
+        return []
+    removed = []
+    for name in sorted(os.listdir(directory)):
+        rel = os.path.join(subdir, name)
+        if rel not in files and os.path.isfile(os.path.join(directory, name)):
+            os.remove(os.path.join(directory, name))
+            removed.append(rel)
+    return removed
+
+
+def build_site(output_dir: str, changed: List[str]):
+    """
+    Runs `mkdocs build` in-process. When only pages changed, dirty mode makes
+    mkdocs rebuild just the pages whose sources are newer than their output;
+    a changed mkdocs.yml (nav, theme, extensions) needs a full build.
+    """
+    from mkdocs.commands.build import build
+    from mkdocs.config import load_config
+
+    config_file = os.path.join(output_dir, "mkdocs.yml")
+    config = load_config(config_file=config_file)
+    site_exists = os.path.isdir(config["site_dir"])
+    dirty = site_exists and "mkdocs.yml" not in changed
+    print(f"Building site ({'incremental' if dirty else 'full'}) in {config['site_dir']}")
+    build(config, dirty=dirty)